@@ -25,13 +25,36 @@ class Batch:
 		# Store only .its files in map
 		for f in allfiles:
 			if ".its" in f:
-				#Load xml tree to get subject ID
+				#Read the file header to get subject ID
 				fullpath = join(batDir, f)
-				tree = ET.parse(fullpath)
-				subInfoNode = tree.find("ExportData/Child")
-				subID = subInfoNode.attrib["id"]
+				subID = self.ReadSubjectID(fullpath)
 				
 				# Add a new subject ID and filename to the map
 				if subID not in self.items:
 					self.items[subID] = []
 				self.items[subID].append(fullpath)
+
+	def ReadSubjectID(self,path):
+		# Scan only the start of the file: stop at the ExportData/Child node, or give up once the
+		# ProcessingUnit (the bulk of the file) begins
+		depth = 0
+		inExport = False
+		with open(path, 'rb') as f:
+			for event, elem in ET.iterparse(f, events=('start','end')):
+				if event == 'end':
+					depth -= 1
+					if depth == 1:
+						inExport = False
+					continue
+				depth += 1
+				if depth == 2 and elem.tag == 'ExportData':
+					inExport = True
+				elif depth == 2 and elem.tag == 'ProcessingUnit':
+					break
+				elif depth == 3 and inExport and elem.tag == 'Child' and 'id' in elem.attrib:
+					return elem.attrib["id"]
+
+		# Fall back on a full parse
+		tree = ET.parse(path)
+		subInfoNode = tree.find("ExportData/Child")
+		return subInfoNode.attrib["id"]
@@ -0,0 +1,93 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Checks the start-up cost of the analysis core when it is used without the user interface, as by cli.py.
+
+Each repeat imports the core modules in a fresh interpreter and reports the time taken. The check fails if the
+median time is over the budget, or if the import pulled in the user interface (Tkinter), an output writer that
+is only needed once results are written (xlsxwriter), or NumPy, which is only needed once events are counted.
+
+Usage:
+	python bench_import.py [--repeat 10] [--budget-ms 250]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# modules a headless run imports
+CORE = ['Batch', 'Helpers', 'SeqAnalysis2', 'cli']
+
+# modules the core must not import
+EXCLUDED = ['Tkinter', 'ttk', 'tkFileDialog', 'tkMessageBox', 'xlsxwriter', 'numpy']
+
+# run in the fresh interpreter: prints the import time in seconds and the excluded modules that got loaded
+PROBE = '''
+import sys, time
+t = time.time()
+%s
+t = time.time() - t
+print t
+print ','.join(m for m in %r if sys.modules.get(m) is not None)
+'''
+
+def TimeImport():
+	"""
+	Imports the core modules in a new interpreter.
+	:return tuple of the import time in seconds and the list of excluded modules loaded:
+	"""
+	code = PROBE % ('\n'.join('import ' + m for m in CORE), EXCLUDED)
+	out = subprocess.check_output([sys.executable, '-c', code], cwd=SRC)
+	seconds, loaded = out.splitlines()[-2:]
+	return float(seconds), [m for m in loaded.split(',') if m]
+
+def main():
+	parser = argparse.ArgumentParser(description='Import-time budget of the headless analysis core')
+	parser.add_argument('--repeat', type=int, default=10)
+	parser.add_argument('--budget-ms', type=float, default=250.0)
+	args = parser.parse_args()
+
+	times = []
+	loaded = set()
+	for i in range(args.repeat):
+		seconds, modules = TimeImport()
+		times.append(seconds)
+		loaded.update(modules)
+	times.sort()
+	median = times[len(times) // 2] * 1000
+
+	print 'imported: %s' % ', '.join(CORE)
+	print 'median: %8.1fms' % median
+	print 'min:    %8.1fms' % (times[0] * 1000)
+	print 'budget: %8.1fms' % args.budget_ms
+	failed = False
+	if loaded:
+		print 'LOADED %s, which the core must not import!' % ', '.join(sorted(loaded))
+		failed = True
+	if median > args.budget_ms:
+		print 'OVER BUDGET!'
+		failed = True
+	if failed:
+		sys.exit(1)
+	print 'within budget'
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,158 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Benchmarks pause insertion and removal on a synthetic recording with long stretches of silence.
+
+"before" is the original approach: every pause is created, the whole list is deep-copied, and each unwanted pause
+is then taken out with list.remove(). "after" is EItemList.InsertPauses(trim=True), which keeps each gap as a
+run length and only walks the pauses that are kept. Both must produce the same sequence once the runs are written
+out, which is done after the timing.
+
+Usage:
+	python bench_pauses.py [--hours 8] [--pause-dur 1.0] [--keep 1.0] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from copy import deepcopy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from ItsReader import ReadItsFile
+from SeqAnalysis2 import EItem, EItemList
+
+SPEAKERS = ['MAN', 'FAN', 'CHN', 'CXN', 'TVN', 'OLN']
+
+def WriteSilentRecording(path, hours, seed):
+	"""
+	Writes an .its file of short bursts of speech separated by silences of ten minutes to an hour.
+	"""
+	r = random.Random(seed)
+	t = 0.0
+	end = hours * 3600.0
+	with open(path, 'w') as f:
+		f.write('<?xml version="1.0" encoding="UTF-8"?>\n<ITS>\n<ExportData><Child id="BENCH"/></ExportData>\n')
+		f.write('<ProcessingUnit><Recording num="1">\n')
+		while t < end:
+			f.write('<Conversation>\n')
+			for i in range(r.randint(20, 200)):
+				t += r.uniform(0.0, 3.0)
+				d = r.uniform(0.3, 3.0)
+				f.write('<Segment spkr="%s" startTime="PT%.2fS" endTime="PT%.2fS"%s/>\n'
+					% (r.choice(SPEAKERS), t, t + d, ' startUtt1="x"' if r.random() < 0.5 else ''))
+				t += d
+			f.write('</Conversation>\n')
+			t += r.uniform(600.0, 3600.0)
+		f.write('</Recording></ProcessingUnit>\n</ITS>\n')
+
+def Before(eiList):
+	"""
+	The original algorithm, kept here as the reference.
+	"""
+	items = [EItem(spkr, onset, offset) for spkr, onset, offset in
+		((eiList.events.spkrs[c], on, off) for c, on, off in zip(eiList.events.codes, eiList.events.onsets, eiList.events.offsets))]
+	expanded = [deepcopy(items[0])]
+	P = eiList.pauseDur
+	for i in range(1, len(items)):
+		curEvT = items[i].onset
+		preEvT = items[i - 1].offset
+		eT = curEvT - preEvT
+		if eT >= P:
+			numP = int((eT / P) + .5) if eiList.round else int(float(eT) / float(P))
+			for j in range(0, numP):
+				startTime = preEvT + (j * P)
+				expanded.append(EItem("Pause", startTime, min(curEvT, startTime + P)))
+		expanded.append(deepcopy(items[i]))
+	expanded = deepcopy(expanded)
+
+	timeOfContiguousPauses = 0.0
+	unwantedPauses = []
+	secondsToKeep = int(eiList.pauseKeep * 60)
+	for item in expanded:
+		if item.spkr != 'Pause':
+			timeOfContiguousPauses = 0.0
+		if item.spkr == 'Pause':
+			timeOfContiguousPauses += (item.offset - item.onset)
+		if (timeOfContiguousPauses > secondsToKeep) and (item.spkr == 'Pause'):
+			unwantedPauses.append(item)
+	for pause in unwantedPauses:
+		expanded.remove(pause)
+	return [(e.spkr, e.onset, e.offset) for e in expanded]
+
+def After(eiList):
+	"""
+	The current run-length insertion with trimming.
+	"""
+	eiList.InsertPauses(CSV=False, trim=True)
+
+def main():
+	parser = argparse.ArgumentParser(description='Pause insertion/removal benchmark on a long-silence recording')
+	parser.add_argument('--hours', type=float, default=8.0)
+	parser.add_argument('--pause-dur', type=float, default=1.0)
+	parser.add_argument('--keep', type=float, default=1.0, help='minutes of contiguous pause to keep')
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	fd, path = tempfile.mkstemp(suffix='.its')
+	os.close(fd)
+	try:
+		WriteSilentRecording(path, args.hours, args.seed)
+		events = ReadItsFile(path).events
+	finally:
+		os.remove(path)
+
+	varMap = {'A': 'MAN,FAN', 'B': 'CHNSP,CHNNSP', 'C': '', 'seqType': 'A_B', 'PauseDur': str(args.pause_dur),
+		'PauseKeep': str(args.keep), 'keepAllPauses': '0', 'roundingEnabled': '0', 'P': 'Pause'}
+	lists = []
+	for i in range(2):
+		eiList = EItemList(_varMap=varMap, pid='bench', filename='bench.its')
+		eiList.AddEvents(events)
+		lists.append(eiList)
+
+	devnull = open(os.devnull, 'w')
+	stdout = sys.stdout
+	sys.stdout = devnull
+	try:
+		t = time.time()
+		before = Before(lists[0])
+		tBefore = time.time() - t
+
+		t = time.time()
+		After(lists[1])
+		tAfter = time.time() - t
+	finally:
+		sys.stdout = stdout
+	lists[1].Expand()
+	ev = lists[1].events
+	after = [(ev.spkrs[c], on, off) for c, on, off in zip(ev.codes, ev.onsets, ev.offsets)]
+
+	print 'events in recording: %d' % events.Size()
+	print 'events after pauses: %d (%d pauses removed)' % (len(after), lists[1].pausesRemoved)
+	print 'before: %8.3fs' % tBefore
+	print 'after:  %8.3fs' % tAfter
+	print 'speedup: %.1fx' % (tBefore / max(tAfter, 1e-9))
+	if before != after:
+		print 'MISMATCH between before and after!'
+		sys.exit(1)
+	print 'sequences identical'
+
+if __name__ == '__main__':
+	main()
@@ -22,7 +22,7 @@ The purpose of this module is to load all the files from the chosen directory an
 from os import listdir
 from os.path import isfile, join, splitext
 #import pandas as pd
-import xml.etree.ElementTree as ET
+from ItsReader import Ingest, ReadSubjectID
 
 class Batch:
 	def __init__(self,batDir):
@@ -47,14 +47,14 @@ class Batch:
 		# Store only .its and/or .csv files in map
 		for f in allfiles:
 			if ".its" in f:
-				#Load xml tree to get subject ID
+				#Read only the file header to get subject ID; fall back on reading the whole file through the
+				#shared ingestion stage, whose labels and events are then reused by the UI and the analysis
 				fullpath = join(batDir, f)
-				tree = ET.parse(fullpath)
-				subID = 'no subject ID'
-				try:
-					subInfoNode = tree.find("ExportData/Child") #TODO: evidently, not all ITS files have this node. tentative solution implemented
-					subID = subInfoNode.attrib["id"]
-				except:
+				subID = ReadSubjectID(fullpath)
+				if subID is None:
+					subID = Ingest(fullpath).subID
+				if subID is None: #TODO: evidently, not all ITS files have this node. tentative solution implemented
+					subID = 'no subject ID'
 					print '+++ .its file does not contain ExportData/Child node. Setting subject ID to \'no subject ID \''
 				
 				# Add a new subject ID and filename to the map
@@ -0,0 +1,244 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+On-disk cache of the events extracted from .its files. Each file gets a small binary sidecar in the cache directory
+holding its subject ID, speaker table, onset/offset arrays and recording clock times. A sidecar is only used while
+the size and modification time of its .its file are unchanged, and the oldest sidecars are evicted once the cache
+grows past MAX_CACHE_BYTES.
+"""
+
+from array import array
+import hashlib
+import math
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+ENABLED = True
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.lena_contingencies', 'cache')
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+
+MAGIC = 'LCEV'
+VERSION = 2
+EXT = '.lce'
+
+# magic, version, byte order of the arrays, file size, file mtime, number of speakers, number of events, number of
+# recordings, time zone in seconds from UTC (NaN if unknown)
+_HEADER = struct.Struct('<4sHBqdIIId')
+
+_lock = threading.Lock()
+_cacheBytes = [None] # running size of the cache directory, measured on first use
+
+def SidecarPath(path):
+	"""
+	Returns the location of the sidecar for an .its file.
+	:param path:
+	:return path string of the sidecar:
+	"""
+	path = os.path.abspath(path)
+	if isinstance(path, unicode):
+		path = path.encode('utf-8')
+	key = hashlib.sha1(path).hexdigest()
+	return os.path.join(CACHE_DIR, key + EXT)
+
+def Load(path, record):
+	"""
+	Fills record (an ItsReader.ItsRecord) from the sidecar of path if there is a valid one.
+
+	:param path:
+	:param record:
+	:return True if the record was filled from the cache, False otherwise:
+	"""
+	if not ENABLED:
+		return False
+	sidecar = SidecarPath(path)
+	try:
+		with open(sidecar, 'rb') as f:
+			magic, version, order, size, mtime, nSpkrs, nEvents, nRecordings, utcOffset = _HEADER.unpack(
+				f.read(_HEADER.size))
+			if magic != MAGIC or version != VERSION or (size, mtime) != record.stamp:
+				return False
+			record.subID = _ReadString(f)
+			spkrs = [_ReadString(f) for i in range(nSpkrs)]
+			codes = array('H')
+			onsets = array('d')
+			offsets = array('d')
+			codes.fromfile(f, nEvents)
+			onsets.fromfile(f, nEvents)
+			offsets.fromfile(f, nEvents)
+			recordings = array('d')
+			recordings.fromfile(f, 3 * nRecordings)
+	except (IOError, OSError, EOFError, struct.error):
+		return False
+
+	if order != _ByteOrder():
+		codes.byteswap()
+		onsets.byteswap()
+		offsets.byteswap()
+		recordings.byteswap()
+	events = record.events
+	events.spkrs = spkrs
+	events.spkrCodes = dict((s, i) for i, s in enumerate(spkrs))
+	events.codes = codes
+	events.onsets = onsets
+	events.offsets = offsets
+	record.labels = set(spkrs)
+	record.clock = {}
+	if nRecordings:
+		record.clock['recordings'] = [tuple(recordings[i:i + 3]) for i in range(0, len(recordings), 3)]
+	if not math.isnan(utcOffset):
+		record.clock['utcOffset'] = utcOffset
+
+	# mark as recently used for eviction
+	try:
+		os.utime(sidecar, None)
+	except OSError:
+		pass
+	return True
+
+def Save(record):
+	"""
+	Writes the sidecar of a freshly read record. Failures are reported but never interrupt the analysis.
+
+	:param record:
+	:return:
+	"""
+	if not ENABLED:
+		return
+	events = record.events
+	recordings = array('d', [x for recording in record.clock.get('recordings', []) for x in recording])
+	utcOffset = record.clock.get('utcOffset')
+	try:
+		if not os.path.isdir(CACHE_DIR):
+			os.makedirs(CACHE_DIR)
+		fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=CACHE_DIR)
+		with os.fdopen(fd, 'wb') as f:
+			f.write(_HEADER.pack(MAGIC, VERSION, _ByteOrder(), record.stamp[0], record.stamp[1],
+				len(events.spkrs), events.Size(), len(recordings) // 3,
+				float('nan') if utcOffset is None else utcOffset))
+			_WriteString(f, record.subID)
+			for spkr in events.spkrs:
+				_WriteString(f, spkr)
+			events.codes.tofile(f)
+			events.onsets.tofile(f)
+			events.offsets.tofile(f)
+			recordings.tofile(f)
+		sidecar = SidecarPath(record.path)
+		with _lock:
+			old = os.path.getsize(sidecar) if os.path.exists(sidecar) else 0
+			if os.path.exists(sidecar):
+				os.remove(sidecar)
+			os.rename(tmp, sidecar)
+			_Account(os.path.getsize(sidecar) - old)
+	except (IOError, OSError) as e:
+		print '+++ Could not write event cache for ' + record.path + ': ' + str(e)
+
+def Invalidate(path=None):
+	"""
+	Removes the sidecar of one .its file, or, without a path, empties the whole cache.
+
+	:param path:
+	:return:
+	"""
+	with _lock:
+		if path is not None:
+			sidecars = [SidecarPath(path)]
+		elif os.path.isdir(CACHE_DIR):
+			sidecars = [os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR) if f.endswith(EXT)]
+		else:
+			sidecars = []
+		for sidecar in sidecars:
+			try:
+				os.remove(sidecar)
+			except OSError:
+				pass
+		_cacheBytes[0] = None
+
+def _Account(delta):
+	"""
+	Updates the running cache size and evicts the least recently used sidecars when it exceeds MAX_CACHE_BYTES.
+	Caller must hold _lock.
+	"""
+	if _cacheBytes[0] is None:
+		_cacheBytes[0] = sum(size for size, mtime, sidecar in _Sidecars())
+	else:
+		_cacheBytes[0] += delta
+	if _cacheBytes[0] <= MAX_CACHE_BYTES:
+		return
+
+	# evict oldest first until the cache is back under 90% of its budget
+	for size, mtime, sidecar in sorted(_Sidecars(), key=lambda s: s[1]):
+		if _cacheBytes[0] <= MAX_CACHE_BYTES * 0.9:
+			break
+		try:
+			os.remove(sidecar)
+			_cacheBytes[0] -= size
+		except OSError:
+			pass
+
+def _Sidecars():
+	"""
+	Returns (size, mtime, path) for every sidecar in the cache directory.
+	"""
+	found = []
+	for f in os.listdir(CACHE_DIR):
+		if f.endswith(EXT):
+			sidecar = os.path.join(CACHE_DIR, f)
+			try:
+				st = os.stat(sidecar)
+			except OSError:
+				continue
+			found.append((st.st_size, st.st_mtime, sidecar))
+	return found
+
+def _ByteOrder():
+	"""
+	Returns 0 on little-endian and 1 on big-endian machines.
+	"""
+	return 0 if sys.byteorder == 'little' else 1
+
+def _WriteString(f, s):
+	"""
+	Writes an optional unicode/str value as a length-prefixed utf-8 string; None is stored as length 0xFFFFFFFF.
+	"""
+	if s is None:
+		f.write(struct.pack('<I', 0xFFFFFFFF))
+		return
+	if isinstance(s, unicode):
+		s = s.encode('utf-8')
+	f.write(struct.pack('<I', len(s)))
+	f.write(s)
+
+def _ReadString(f):
+	"""
+	Reads a string written by _WriteString().
+	"""
+	n, = struct.unpack('<I', f.read(4))
+	if n == 0xFFFFFFFF:
+		return None
+	s = f.read(n)
+	if len(s) != n:
+		raise EOFError('truncated event cache')
+	# ElementTree hands out plain strings for ascii text and unicode otherwise
+	try:
+		s.decode('ascii')
+	except UnicodeDecodeError:
+		s = s.decode('utf-8')
+	return s
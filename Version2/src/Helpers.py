@@ -20,8 +20,30 @@ Contains class definitions and methods for use in SeqAnalysis2.py.
 """
 
 import csv
-import xlsxwriter
 import datetime
+import itertools
+import os
+import pkgutil
+
+# Execution backends for SeqAnalysis
+THREAD_BACKEND = 'thread'
+PROCESS_BACKEND = 'process'
+
+# sequence types a pattern of seq_config['patterns'] can use
+PATTERN_SEQ_TYPES = ('A_B', 'AB_C', 'A_BC')
+
+# seq_config settings that a parameter sweep can vary, in the order they appear in the output
+SWEEP_KEYS = ('PauseDur', 'PauseKeep', 'roundingEnabled', 'keepAllPauses')
+
+# swept settings that are switched on or off; EItemList takes them as on when they contain "1"
+SWEEP_SWITCHES = ('roundingEnabled', 'keepAllPauses')
+
+# speaker codes that A, B and C can be chosen from
+SPEAKER_CODES = ('MAN', 'MAF', 'FAN', 'FAF', 'CHNSP', 'CHNNSP', 'CHF', 'CXN', 'CXF', 'NON', 'NOF', 'OLN', 'OLF', 'TVN',
+                 'TVF', 'SIL')
+
+# output file extensions, in the order they are written
+OUTPUT_FORMATS = ('.xlsx', '.csv', '.txt')
 
 # Sequence Analysis Data Object
 # Holds all items needed for analysis
@@ -34,24 +56,41 @@ class SeqData:
     seq_config = None
     num_threads = None
     output_format = None
+    backend = None
+    largest_first = None
+    sweep = None
+    reuse_results = None
 
-    def __init__(self, its_dict, seq_config, num_threads, output_format):
+    def __init__(self, its_dict, seq_config, num_threads, output_format, backend=THREAD_BACKEND, largest_first=True,
+                 sweep=None, reuse_results=True):
         """
         Initializes the SeqData object with the dictionary of files, the sequence configuration, number of
-        threads for analysis and the format of the output.
+        workers for analysis, the format of the output, the execution backend (THREAD_BACKEND or
+        PROCESS_BACKEND), whether the largest files are analysed first, and an optional parameter sweep.
+        A sweep maps some of SWEEP_KEYS to lists of values; every file is then analysed at every combination
+        of them and the results are written as one long-format table. With reuse_results, files unchanged since
+        an earlier run of the same analysis into the same output directory are not analysed again.
 
         :param its_dict:
         :param seq_config:
         :param num_threads:
         :param output_format:
+        :param backend:
+        :param largest_first:
+        :param sweep:
+        :param reuse_results:
         """
         self.num_threads = num_threads
         self.its_dict = its_dict
         self.seq_config = seq_config
         self.output_format = output_format
+        self.backend = backend
+        self.largest_first = largest_first
+        self.sweep = sweep
+        self.reuse_results = reuse_results
 
 # Sequence Analysis Run Object
-# Put into queue; used in Perform()
+# Put into the work queue by SeqAnalysis; used in Perform()
 class SeqRun:
     """
     The Run object creates an id and path for the analysis.
@@ -78,19 +117,372 @@ class OutData:
     batch_store = None
     seq_config = None
     results = None
+    sweep = None
+    patterns = None
 
-    def __init__(self, batch_store, seq_config, results):
+    def __init__(self, batch_store, seq_config, results, sweep=False, patterns=False):
         """
         Initializes the OutData object with the number of analyses completes, the sequence analyzed,
-        and the resulting data.
+        the resulting data, and whether the results come from a parameter sweep or a pattern list.
 
         :param batch_store:
         :param seq_config:
         :param results:
+        :param sweep:
+        :param patterns:
         """
         self.batch_store = batch_store
         self.seq_config = seq_config
         self.results = results
+        self.sweep = sweep
+        self.patterns = patterns
+
+def sweep_grid(sweep, seq_config=None):
+    """
+    Expands a parameter sweep into the list of seq_config overrides for every combination of its values. The
+    switches the sweep leaves out are taken from seq_config, if given, and normalised like the swept ones, so that
+    every switch is applied and written the same way.
+    :param sweep: dict of setting in SWEEP_KEYS -> list of values
+    :param seq_config:
+    :return list of dicts:
+    """
+    sweep = dict(sweep)
+    for key in SWEEP_SWITCHES:
+        if key not in sweep and seq_config is not None and seq_config.get(key) is not None:
+            sweep[key] = [seq_config[key]]
+    sweep = normalize_sweep(sweep)
+    keys = [k for k in SWEEP_KEYS if k in sweep]
+    return [dict(zip(keys, values)) for values in itertools.product(*[sweep[k] for k in keys])]
+
+def normalize_sweep(sweep):
+    """
+    Checks the values of a parameter sweep and writes them the way EItemList reads them: switches as '1' or '0'
+    (from 1/0 or True/False), durations as numbers. Raises ValueError for a value that would not be applied.
+    :param sweep: dict of setting in SWEEP_KEYS -> list of values
+    :return dict of setting -> list of value strings:
+    """
+    normalized = {}
+    for key, values in sweep.items():
+        if key not in SWEEP_KEYS:
+            raise ValueError("Cannot sweep " + key + ", expected one of " + ', '.join(SWEEP_KEYS))
+        normalized[key] = []
+        for value in values:
+            text = str(value).strip()
+            if key in SWEEP_SWITCHES:
+                if text.lower() in ('1', 'true'):
+                    text = '1'
+                elif text.lower() in ('0', 'false'):
+                    text = '0'
+                else:
+                    raise ValueError("Invalid " + key + " " + text + ", expected 1/0 or True/False")
+            else:
+                try:
+                    duration = float(text)
+                except ValueError:
+                    raise ValueError("Invalid " + key + " " + text + ", expected a number")
+                if key == 'PauseDur' and duration < 0.1:
+                    raise ValueError("Invalid PauseDur " + text + ", expected at least 0.1")
+                if duration < 0:
+                    raise ValueError("Invalid " + key + " " + text + ", expected a positive number")
+            normalized[key].append(text)
+    return normalized
+
+def pattern_configs(seq_config):
+    """
+    Expands seq_config['patterns'], a list of dicts each giving A, B and optionally C, seqType and name, into one
+    (name, seq_config) pair per pattern. Settings a pattern does not give are taken from seq_config, except C,
+    which a pattern of a three-event seqType must give itself. Raises ValueError for an invalid pattern.
+    :param seq_config:
+    :return list of (name, seq_config) tuples:
+    """
+    configs = []
+    for i, pattern in enumerate(seq_config['patterns']):
+        if 'A' not in pattern or 'B' not in pattern:
+            raise ValueError("Pattern " + str(i + 1) + " needs at least A and B")
+        config = dict(seq_config)
+        config['C'] = ''
+        config.update(pattern)
+        if config['seqType'] not in PATTERN_SEQ_TYPES:
+            raise ValueError("Pattern " + str(i + 1) + " has an invalid seqType: " + str(config['seqType']))
+        e = invalid_speakers(config)
+        if e is not None:
+            raise ValueError("Pattern " + str(i + 1) + " has no valid speaker for " + e + " of seqType " +
+                             config['seqType'])
+        # one table per pattern, so that every row has the same columns
+        config['allSeqTypes'] = 'False'
+        config['maxLag'] = '0'
+        name = str(pattern.get('name', 'pattern' + str(i + 1))).replace(',', ' ')
+        configs.append((name, config))
+    return configs
+
+def invalid_speakers(seq_config):
+    """
+    Returns the first of A, B and C that names none of SPEAKER_CODES. C is only checked for three-event sequences,
+    or with allSeqTypes, which computes the three-event sequences too.
+    :param seq_config:
+    :return 'A', 'B', 'C' or None:
+    """
+    three = seq_config['seqType'] != 'A_B' or str(seq_config.get('allSeqTypes', 'False')) in ('True', '1')
+    for e in (['A', 'B', 'C'] if three else ['A', 'B']):
+        if not any(x in SPEAKER_CODES for x in str(seq_config.get(e, '')).split(',')):
+            return e
+    return None
+
+def validate_config(seq_config):
+    """
+    Checks a configuration loaded from a .leco file, as written by the UI's save option. Raises ValueError naming
+    the first invalid setting.
+    :param seq_config:
+    :return:
+    """
+    # check batDir
+    if len(seq_config['batDir']) < 2:
+        raise ValueError("batDir invalid")
+
+    # check outputDir
+    if len(seq_config['outputDirPath']) < 2:
+        raise ValueError("Invalid outputDirPath!")
+
+    # check SeqType
+    if seq_config['seqType'] not in PATTERN_SEQ_TYPES:
+        raise ValueError("seqType Invalid")
+
+    # check A, B and, for three-event sequences or allSeqTypes, C
+    e = invalid_speakers(seq_config)
+    if e is not None:
+        raise ValueError("Invalid Var " + e)
+
+    # check rounding enabled
+    if seq_config['roundingEnabled'] not in ('True', 'False'):
+        raise ValueError("Invalid roundingEnabled!")
+
+    # check pause duration
+    if float(seq_config['PauseDur']) < 0.1:
+        raise ValueError("Invalid pause duration!")
+
+    # check the pattern list, if any
+    if seq_config.get('patterns'):
+        pattern_configs(seq_config)
+
+    # check the intervals, if any, which are given for every file or per PID or file name
+    intervals = seq_config.get('intervals')
+    if intervals:
+        for file_list in (intervals.values() if isinstance(intervals, dict) else [intervals]):
+            file_intervals(dict(seq_config, intervals=file_list), None, '')
+
+    # check output formats
+    formats = output_formats(seq_config)
+    if not formats:
+        raise ValueError("Invalid output types!")
+    if '.xlsx' in formats and not xlsx_available():
+        raise ValueError("xlsxwriter is not installed, needed for .xlsx output!")
+
+def output_formats(seq_config):
+    """
+    Returns the output file extensions selected by seq_config['outputTypes'].
+    :param seq_config:
+    :return list of extension strings:
+    """
+    return [ext for ext in OUTPUT_FORMATS if ext[1:] in seq_config['outputTypes']]
+
+def xlsx_available():
+    """
+    Tells whether xlsxwriter can be imported, without importing it. xlsxwriter is only imported by XlsxWriter,
+    so that the analysis modules load quickly and work without it when no .xlsx output is wanted.
+    :return True or False:
+    """
+    return pkgutil.find_loader('xlsxwriter') is not None
+
+def file_intervals(seq_config, p_id, path):
+    """
+    Returns the intervals of one file to analyse. seq_config['intervals'] is either a list of [start, end] pairs used
+    for every file, or a dict giving such a list per PID or file name. Times are either all minutes from the start of
+    the recording, or all "H:MM[:SS]" clock times of day, which the analysis finds in each recording from its clock
+    times; a clock time interval that ends before it starts runs past midnight.
+    :param seq_config:
+    :param p_id:
+    :param path:
+    :return tuple of the list of (start, end) tuples in seconds, from the start of the recording or from midnight, and
+    True if they are clock times:
+    """
+    intervals = seq_config.get('intervals') or []
+    if isinstance(intervals, dict):
+        intervals = intervals.get(p_id, intervals.get(os.path.basename(path), []))
+    pairs = []
+    clock_times = set()
+    for start, end in intervals:
+        clock_times.update([is_clock_time(start), is_clock_time(end)])
+        if len(clock_times) > 1:
+            raise ValueError("Intervals mix minutes and clock times: " + str(start) + "-" + str(end))
+        start, end = interval_seconds(start), interval_seconds(end)
+        if True in clock_times and end < start:
+            end += 24 * 60 * 60
+        if end <= start:
+            raise ValueError("Interval ends before it starts: " + str(start) + "-" + str(end) + " s")
+        pairs.append((start, end))
+    return pairs, True in clock_times
+
+def is_clock_time(value):
+    """
+    Tells whether an interval time is an "H:MM[:SS]" clock time of day rather than minutes from the start of the
+    recording.
+    :param value:
+    :return True or False:
+    """
+    return isinstance(value, basestring) and ':' in value
+
+def interval_seconds(value):
+    """
+    Converts an interval time given in minutes from the start of the recording, or as an "H:MM[:SS]" clock time of
+    day, to seconds from the start of the recording or from midnight.
+    :param value:
+    :return float seconds:
+    """
+    if is_clock_time(value):
+        parts = [float(p) for p in value.split(':')]
+        parts += [0.0] * (3 - len(parts))
+        if len(parts) > 3 or not 0 <= parts[0] <= 24 or not 0 <= parts[1] < 60 or not 0 <= parts[2] < 60:
+            raise ValueError("Invalid clock time " + value + ", expected H:MM or H:MM:SS")
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return float(value) * 60
+
+def output_file_name(out_data, extension):
+    """
+    Builds the path of an output file from the batch type, sequence type, pause settings, bins and intervals.
+    :param out_data:
+    :param extension:
+    :return path string:
+    """
+    if out_data.sweep:
+        settings = "sweep"
+    else:
+        settings = str(out_data.seq_config['PauseDur']).replace('.','p')+"-"+str(out_data.seq_config['roundingEnabled'])
+    if float(out_data.seq_config.get('binWidth', '0') or 0) > 0:
+        settings += "-bins" + str(out_data.seq_config['binWidth']).replace('.','p')
+    if out_data.seq_config.get('intervals'):
+        settings += "-intervals"
+    seq_type = "patterns" if out_data.patterns else out_data.seq_config['seqType']
+    return out_data.seq_config['outputDirPath'] +'//'+ "LC2-"+out_data.batch_store+"-"+seq_type+"-"+settings+"-"+datetime.datetime.now().strftime('%m%d%y-%H%M')+extension
+
+# Streaming output writers
+# opened by SeqAnalysis before the first file is analysed; the results of each file are written as soon as it is done
+class ResultWriter:
+    """
+    Base class of the output writers. A writer creates its output file when opened, takes rows of fields through
+    write_rows() and finishes the file on close(). By itself it writes each row as a comma-separated line of text;
+    the other formats override open(), write_rows() and close().
+    """
+    extension = ".txt"
+    mode = 'w'
+    path = None
+
+    def __init__(self, out_data):
+        """
+        Creates the output file named by out_data.
+        :param out_data:
+        """
+        print("Output in " + self.extension)
+        self.path = output_file_name(out_data, self.extension)
+        self.open()
+
+    def open(self):
+        """
+        Opens the output file at self.path.
+        :return:
+        """
+        self.file = open(self.path, self.mode)
+
+    def write_rows(self, rows):
+        """
+        Writes rows of fields and flushes them to disk.
+        :param rows: iterable of lists of field values: strings, integers, floats
+        :return:
+        """
+        for fields in rows:
+            self.file.write(','.join(str(field) for field in fields) + "\n")
+        self.file.flush()
+
+    def close(self):
+        """
+        Finishes the output file.
+        :return:
+        """
+        self.file.close()
+
+    def discard(self):
+        """
+        Closes and removes the output file of an analysis that was cancelled.
+        :return:
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class TxtWriter(ResultWriter):
+    """
+    Writes the results to a .txt file, one comma-separated line per row.
+    """
+    extension = ".txt"
+
+class CsvWriter(ResultWriter):
+    """
+    Writes the results to a .csv file.
+    """
+    extension = ".csv"
+    mode = 'wb'
+
+    def open(self):
+        ResultWriter.open(self)
+        self.writer = csv.writer(self.file, delimiter=',')
+
+    def write_rows(self, rows):
+        # str() rather than the csv module's repr() of floats, the same text as the .txt output
+        for fields in rows:
+            self.writer.writerow([str(field) for field in fields])
+        self.file.flush()
+
+class XlsxWriter(ResultWriter):
+    """
+    Writes the results to a .xlsx file, numbers as numeric cells. The workbook is in constant memory mode, so every
+    row is moved out of memory once the next one is started and the file is put together on close().
+    """
+    extension = ".xlsx"
+
+    def open(self):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True})
+        self.worksheet = self.workbook.add_worksheet()
+        self.row = 0
+
+    def write_rows(self, rows):
+        for fields in rows:
+            self.worksheet.write_row(self.row, 0, fields)
+            self.row += 1
+
+    def close(self):
+        self.workbook.close()
+
+OUTPUT_WRITERS = {'.xlsx': XlsxWriter, '.csv': CsvWriter, '.txt': TxtWriter}
+
+def open_writers(out_data, output_format):
+    """
+    Opens a writer for each selected output format.
+    :param out_data:
+    :param output_format: list of extension strings
+    :return list of ResultWriter objects:
+    """
+    return [OUTPUT_WRITERS[ext](out_data) for ext in OUTPUT_FORMATS if ext in output_format]
+
+def write_results(writer_class, out_data):
+    """
+    Writes the complete list of results of out_data with one writer.
+    :param writer_class:
+    :param out_data: with results as rows of fields, or as comma-joined strings
+    :return:
+    """
+    writer = writer_class(out_data)
+    writer.write_rows(line.split(',') if isinstance(line, basestring) else line for line in out_data.results)
+    writer.close()
 
 # Output to CSV format
 def output_csv(out_data):
@@ -99,16 +491,7 @@ def output_csv(out_data):
     :param out_data:
     :return:
     """
-    # output code
-    print("Output in .csv")
-
-    # create + write csv file
-    out_file = out_data.seq_config['outputDirPath'] +'//'+ "LC2-"+out_data.batch_store+"-"+out_data.seq_config['seqType']+"-"+str(out_data.seq_config['PauseDur']).replace('.','p')+"-"+str(out_data.seq_config['roundingEnabled'])+"-"+datetime.datetime.now().strftime('%m%d%y-%H%M')+".csv"
-    with open( out_file, 'wb') as f:#open csv file to be written in
-        csv_writer = csv.writer(f, delimiter = ',')
-        for line in out_data.results:#loop to write rows to csv file
-            line = line.split(',')
-            csv_writer.writerow(line)
+    write_results(CsvWriter, out_data)
 
 # Output to TXT format
 def ouput_txt(out_data):
@@ -117,14 +500,7 @@ def ouput_txt(out_data):
     :param out_data:
     :return:
     """
-    # output code 
-    print("Output in .txt")
-
-    # create + write txt file
-    out_file = out_data.seq_config['outputDirPath'] +'//'+ "LC2-"+out_data.batch_store+"-"+out_data.seq_config['seqType']+"-"+str(out_data.seq_config['PauseDur']).replace('.','p')+"-"+str(out_data.seq_config['roundingEnabled'])+"-"+datetime.datetime.now().strftime('%m%d%y-%H%M')+".txt"
-    with open(out_file,'w') as f:
-        for line in out_data.results:
-            f.writelines(line+"\n")
+    write_results(TxtWriter, out_data)
 
 # Output to Excel format
 def output_xlsx(out_data):
@@ -133,22 +509,4 @@ def output_xlsx(out_data):
     :param out_data:
     :return:
     """
-    print("Output in .xlsx")
-    # create workbook & add sheet
-    out_file = out_data.seq_config['outputDirPath'] +'//'+ "LC2-"+out_data.batch_store+"-"+out_data.seq_config['seqType']+"-"+str(out_data.seq_config['PauseDur']).replace('.','p')+"-"+str(out_data.seq_config['roundingEnabled'])+"-"+datetime.datetime.now().strftime('%m%d%y-%H%M')+".xlsx"
-    workbook = xlsxwriter.Workbook(out_file)
-    worksheet = workbook.add_worksheet()
-
-    # start from first cell
-    row = 0
-    
-    # insert into worksheet
-    for line in out_data.results:
-        col = 0
-        for cell in str(line).split(","):
-            worksheet.write(row, col, cell)
-            col += 1
-        row += 1
-
-    # close file
-    workbook.close()
+    write_results(XlsxWriter, out_data)
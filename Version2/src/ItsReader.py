@@ -0,0 +1,496 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Reads .its files incrementally. Segments are handed out one at a time and every node is discarded as soon as it
+has been used, so the memory needed to read a file does not grow with the length of the recording.
+
+Each .its file is read once into an ItsRecord holding the subject ID, the speaker labels, a compact event stream and
+the clock times of its recordings.
+Records are kept in a shared store so that Batch, the UI and the analysis all reuse the same read, and are saved
+to the on-disk EventCache so that later runs over the same files skip the XML altogether.
+"""
+
+try:
+	import xml.etree.cElementTree as ET
+except ImportError:
+	import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left, bisect_right
+import calendar
+from copy import copy
+from itertools import izip, islice
+import os
+import threading
+import time
+import EventCache
+
+# upper bound on the number of events kept in the shared store; records read past this point keep only their
+# subject ID and labels and are read again when the analysis needs their events
+MAX_STORED_EVENTS = 10000000
+
+# .its files of at least this many bytes are analysed straight from the XML (see IterEvents) rather than read into
+# an EventStream first, so their length does not decide the memory needed
+STREAM_MIN_BYTES = 512 * 1024 * 1024
+
+DAY = 24 * 60 * 60
+
+# Event Stream
+class EventStream:
+	"""
+	Compact sequence of events. Speakers are interned to small integer codes and onsets/offsets are kept in
+	parallel typed arrays.
+	"""
+	def __init__(self):
+		"""
+		Initializes an empty event stream.
+		"""
+		self.spkrs = [] # code -> speaker label
+		self.spkrCodes = {} # speaker label -> code
+		self.codes = array('H')
+		self.onsets = array('d')
+		self.offsets = array('d')
+		self._index = None # (size, onset order) of OnsetOrder(), built on the first interval query
+
+	def Derive(self):
+		"""
+		Returns an empty stream sharing the speaker table of this one, so codes can be copied across unchanged.
+		:return EventStream:
+		"""
+		derived = EventStream()
+		derived.spkrs = self.spkrs
+		derived.spkrCodes = self.spkrCodes
+		return derived
+
+	def Code(self, spkr):
+		"""
+		Returns the integer code of a speaker label, interning the label if it is new.
+		:param spkr:
+		:return integer speaker code:
+		"""
+		code = self.spkrCodes.get(spkr)
+		if code is None:
+			code = len(self.spkrs)
+			self.spkrCodes[spkr] = code
+			self.spkrs.append(spkr)
+		return code
+
+	def Append(self, spkr, onset, offset):
+		"""
+		Appends an event to the end of the stream.
+
+		:param spkr:
+		:param onset:
+		:param offset:
+		:return:
+		"""
+		self.AppendCode(self.Code(spkr), onset, offset)
+
+	def AppendCode(self, code, onset, offset):
+		"""
+		Appends an event given by its speaker code to the end of the stream.
+
+		:param code:
+		:param onset:
+		:param offset:
+		:return:
+		"""
+		self.codes.append(code)
+		self.onsets.append(onset)
+		self.offsets.append(offset)
+
+	def Size(self):
+		"""
+		Returns the number of events in the stream.
+		:return integer length of the stream:
+		"""
+		return len(self.codes)
+
+	def Between(self, start, end):
+		"""
+		Returns the positions of the events with start <= onset < end, in stream order. The onsets are binary
+		searched, so a query costs O(log n + k) for k events in range once the index exists.
+
+		:param start: seconds
+		:param end: seconds
+		:return sequence of integer positions:
+		"""
+		order = self.OnsetOrder()
+		if order is None:
+			return xrange(bisect_left(self.onsets, start), bisect_left(self.onsets, end))
+		positions, onsets = order
+		return sorted(positions[bisect_left(onsets, start):bisect_left(onsets, end)])
+
+	def OnsetOrder(self):
+		"""
+		Returns None if the onsets are already sorted, otherwise the positions of the events in onset order and
+		the sorted onsets. The result is kept with the stream and only rebuilt after events are appended.
+		:return None or tuple of array('L') positions and array('d') onsets:
+		"""
+		size = len(self.codes)
+		if self._index is None or self._index[0] != size:
+			onsets = self.onsets
+			order = None
+			if any(a > b for a, b in izip(onsets, islice(onsets, 1, None))):
+				positions = sorted(xrange(size), key=onsets.__getitem__)
+				order = (array('L', positions), array('d', (onsets[i] for i in positions)))
+			self._index = (size, order)
+		return self._index[1]
+
+	def Events(self, positions):
+		"""
+		Yields the events at the given positions as (speaker, onset, offset) tuples.
+		:param positions:
+		:return generator of (speaker, onset, offset) tuples:
+		"""
+		spkrs = self.spkrs
+		for i in positions:
+			yield spkrs[self.codes[i]], self.onsets[i], self.offsets[i]
+
+	def __iter__(self):
+		"""
+		Iterates over the stream as (speaker, onset, offset) tuples.
+		"""
+		spkrs = self.spkrs
+		for code, onset, offset in izip(self.codes, self.onsets, self.offsets):
+			yield spkrs[code], onset, offset
+
+# ITS Record
+class ItsRecord:
+	"""
+	Everything the program needs from one .its file, gathered in a single read.
+	"""
+	def __init__(self, path):
+		"""
+		Initializes an empty record for the file at path.
+
+		:param path:
+		"""
+		self.path = path
+		self.subID = None
+		self.labels = set()
+		self.events = EventStream()
+		self.clock = {} # recordings and utcOffset, as gathered by IterSegments(), see RecordingClock
+		self.stamp = FileStamp(path)
+
+# Recording Clock
+class RecordingClock:
+	"""
+	Maps times from the start of a file, as its event onsets are given, to local clock times. Every Recording node
+	of an .its file gives the time it starts at and the UTC clock time it was started at; the recorder can be paused
+	between recordings, so each has its own offset. The time zone is taken from the TransferTime node, without which
+	clock times are UTC. Local clock times are kept as seconds since the epoch, as if the local time were UTC.
+	"""
+	def __init__(self, clock):
+		"""
+		Initializes the clock of a file.
+
+		:param clock: dict of the file's recordings and utcOffset, see IterSegments(); it may still be filling while
+		the file is streamed, as every Recording node comes before its segments
+		"""
+		self.clock = clock
+
+	def Recordings(self):
+		"""
+		Returns the (start, end, UTC clock time at start) tuples of the file's recordings, in seconds.
+		:return list of tuples:
+		"""
+		return self.clock.get('recordings') or []
+
+	def Shift(self, t):
+		"""
+		Returns the seconds to add to a time from the start of the file to get its local clock time.
+		:param t: seconds from the start of the file
+		:return seconds:
+		"""
+		recordings = self.Recordings()
+		if not recordings:
+			raise ValueError('The file has no recording clock times')
+		start, end, clock = recordings[max(0, bisect_right(recordings, (t, float('inf'), float('inf'))) - 1)]
+		return clock - start + (self.clock.get('utcOffset') or 0)
+
+	def Midnight(self):
+		"""
+		Returns the local midnight of the day the first recording started.
+		:return local clock time in seconds:
+		"""
+		start = self.Recordings()[0][0] if self.Recordings() else 0
+		return (start + self.Shift(start)) // DAY * DAY
+
+	def Spans(self, start, end):
+		"""
+		Finds the recorded parts of a daily clock time window, on every day the file covers.
+
+		:param start: seconds after midnight
+		:param end: seconds after midnight, past DAY for a window that ends the next day
+		:return list of (local midnight, list of (start, end) seconds from the start of the file) tuples, by day,
+		leaving out the days on which none of the window was recorded:
+		"""
+		days = {}
+		for first, last, clock in self.Recordings():
+			lo = first + self.Shift(first)
+			hi = lo + (last - first)
+			day = lo // DAY * DAY - DAY
+			while day + start < hi:
+				a, b = max(lo, day + start), min(hi, day + end)
+				if a < b:
+					days.setdefault(day, []).append((first + a - lo, first + b - lo))
+				day += DAY
+		return sorted(days.items())
+
+def ClockLabel(t):
+	"""
+	Formats a local clock time for the output.
+	:param t: local clock time in seconds, see RecordingClock
+	:return "YYYY-MM-DD HH:MM:SS" string:
+	"""
+	return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t))
+
+def ClockSeconds(text):
+	"""
+	Converts an .its clock time such as "2012-03-09T14:03:08Z" to seconds since the epoch.
+	:param text:
+	:return seconds:
+	"""
+	date, clock = text.rstrip('Z').split('T')
+	year, month, day = [int(x) for x in date.split('-')]
+	hours, minutes, seconds = clock.split(':')
+	return calendar.timegm((year, month, day, int(hours), int(minutes), 0)) + float(seconds)
+
+def FileStamp(path):
+	"""
+	Returns the (size, mtime) pair used to tell whether a file changed since it was read.
+	:param path:
+	:return tuple of file size and modification time:
+	"""
+	st = os.stat(path)
+	return (st.st_size, st.st_mtime)
+
+def SegmentLabel(seg):
+	"""
+	Returns the speaker label of a segment, with CHN segments split into CHNSP (speech) and CHNNSP (non-speech)
+	the same way EItemList.Modify_CHN_Events() does.
+
+	:param seg:
+	:return speaker label string, or None if the segment has no speaker:
+	"""
+	spkr = seg.get('spkr')
+	if spkr is not None and 'CHN' in spkr:
+		spkr = 'CHNSP' if 'startUtt1' in seg.attrib else 'CHNNSP'
+	return spkr
+
+def ReadItsFile(path):
+	"""
+	Reads an .its file once, collecting the subject ID, the set of speaker labels and the event stream.
+
+	:param path:
+	:return ItsRecord:
+	"""
+	record = ItsRecord(path)
+	info = {}
+	for spkr, onset, offset in IterEvents(path, info):
+		record.labels.add(spkr)
+		record.events.Append(spkr, onset, offset)
+	record.subID = info.get('subID')
+	record.clock = dict((k, info[k]) for k in ('recordings', 'utcOffset') if k in info)
+	return record
+
+def IterEvents(path, info=None):
+	"""
+	Yields the events of an .its file as (speaker, onset, offset) tuples, in the form ReadItsFile() collects them,
+	without keeping any of them. If a dict is passed as info, the subject ID and the recording clock times are stored
+	in it (see IterSegments).
+
+	:param path:
+	:param info:
+	:return generator of (speaker, onset, offset) tuples:
+	"""
+	last = None
+	for seg, flag in IterSegments(path, info):
+		# a lone segment is handed out as both the initial and the terminal segment
+		if seg is last:
+			continue
+		last = seg
+		spkr = SegmentLabel(seg)
+		if spkr is None:
+			continue
+		yield spkr, float(seg.attrib["startTime"][2:-1]), float(seg.attrib["endTime"][2:-1])
+
+def ReadSubjectID(path):
+	"""
+	Returns the subject ID stored at ExportData/Child by scanning only the start of an .its file. The scan stops at
+	the Child node, or gives up once the ProcessingUnit node (the bulk of the file) begins.
+
+	:param path:
+	:return subject ID string, or None if the header does not contain one:
+	"""
+	depth = 0
+	inExport = False
+	with open(path, 'rb') as f:
+		for event, elem in ET.iterparse(f, events=('start', 'end')):
+			if event == 'end':
+				depth -= 1
+				if depth == 1:
+					inExport = False
+				continue
+			depth += 1
+			if depth == 2 and elem.tag == 'ExportData':
+				inExport = True
+			elif depth == 2 and elem.tag == 'ProcessingUnit':
+				break
+			elif depth == 3 and inExport and elem.tag == 'Child' and 'id' in elem.attrib:
+				return elem.attrib['id']
+	return None
+
+# Shared record store
+_store = {} # key:path, value:ItsRecord
+_storeLock = threading.Lock()
+_storedEvents = [0]
+
+def Ingest(path, events=True):
+	"""
+	Returns the ItsRecord for path. The file is only read if no other consumer has read it since it last changed
+	and the event cache has no valid entry for it; events=False accepts a stored record whose events were dropped.
+
+	:param path:
+	:param events:
+	:return ItsRecord:
+	"""
+	stamp = FileStamp(path)
+	with _storeLock:
+		record = _store.get(path)
+	if record is not None and record.stamp == stamp and (record.events is not None or not events):
+		return record
+
+	record = ItsRecord(path)
+	if not EventCache.Load(path, record):
+		record = ReadItsFile(path)
+		EventCache.Save(record)
+	with _storeLock:
+		_Discard(path)
+		stored = record
+		if _storedEvents[0] + record.events.Size() > MAX_STORED_EVENTS:
+			stored = _WithoutEvents(record)
+		else:
+			_storedEvents[0] += record.events.Size()
+		_store[path] = stored
+	return record
+
+def Release(path):
+	"""
+	Drops the stored events of a file once they are no longer needed, keeping its subject ID and labels.
+
+	:param path:
+	:return:
+	"""
+	with _storeLock:
+		record = _store.get(path)
+		if record is not None and record.events is not None:
+			_storedEvents[0] -= record.events.Size()
+			_store[path] = _WithoutEvents(record)
+
+def Forget(path=None):
+	"""
+	Removes a file (or, without a path, every file) from the shared store.
+
+	:param path:
+	:return:
+	"""
+	with _storeLock:
+		for p in ([path] if path is not None else _store.keys()):
+			_Discard(p)
+
+def _WithoutEvents(record):
+	"""
+	Returns a copy of a record that keeps its subject ID and labels but not its events.
+	"""
+	light = copy(record)
+	light.events = None
+	return light
+
+def _Discard(path):
+	"""
+	Removes a record from the store. Caller must hold _storeLock.
+	"""
+	record = _store.pop(path, None)
+	if record is not None and record.events is not None:
+		_storedEvents[0] -= record.events.Size()
+
+def IterSegments(path, info=None):
+	"""
+	Yields (segment, flag) pairs for every Segment node under the ProcessingUnit node of an .its file, in document
+	order. The flag is 'Initial' for the first segment, 'Terminal' for the last one and None otherwise, as expected
+	by EItemList.AddEItem(). A segment is cleared once the caller asks for the next one.
+	If a dict is passed as info, the subject ID found at ExportData/Child is stored in it under 'subID', the
+	(start, end, UTC clock time at start) of every Recording, in seconds, under 'recordings', and the local time zone
+	of the TransferTime node, in seconds from UTC, under 'utcOffset'.
+
+	:param path:
+	:param info:
+	:return generator of (segment, flag) tuples:
+	"""
+	stack = []
+	inUnit = False
+	unitSeen = False
+	pending = None
+	flag = 'Initial'
+
+	for event, elem in ET.iterparse(path, events=('start', 'end')):
+		if event == 'start':
+			stack.append(elem)
+			# only the first ProcessingUnit directly below the root holds the conversational segments
+			if elem.tag == 'ProcessingUnit' and len(stack) == 2 and not unitSeen:
+				inUnit = True
+				unitSeen = True
+			elif info is not None and elem.tag == 'Child' and len(stack) == 3 and stack[1].tag == 'ExportData':
+				if 'subID' not in info and 'id' in elem.attrib:
+					info['subID'] = elem.attrib['id']
+			elif info is not None and inUnit and elem.tag == 'Recording' and len(stack) == 3:
+				if 'startClockTime' in elem.attrib:
+					end = elem.attrib.get('endTime')
+					info.setdefault('recordings', []).append((float(elem.attrib['startTime'][2:-1]),
+						float(end[2:-1]) if end else float('inf'), ClockSeconds(elem.attrib['startClockTime'])))
+			elif info is not None and elem.tag == 'TransferTime' and 'utcOffset' not in info:
+				if 'LocalTime' in elem.attrib and 'UTCTime' in elem.attrib:
+					offset = ClockSeconds(elem.attrib['LocalTime']) - ClockSeconds(elem.attrib['UTCTime'])
+					info['utcOffset'] = round(offset / 900) * 900
+			elif inUnit and elem.tag == 'Segment':
+				# attributes are complete on the start event; hand out the previous segment now that we
+				# know it is not the last one
+				if pending is not None:
+					yield pending, flag
+					flag = None
+					pending.clear()
+				pending = elem
+		else:
+			stack.pop()
+			if elem.tag == 'ProcessingUnit' and inUnit and len(stack) == 1:
+				inUnit = False
+
+			# detach finished nodes from their parent so the tree never grows; the parser reads ahead, so later
+			# siblings may already be attached and the finished node is not necessarily the last child
+			if stack:
+				stack[-1].remove(elem)
+			if elem is not pending:
+				elem.clear()
+
+	if pending is not None:
+		# a lone segment is both the initial and the terminal segment of the file
+		if flag == 'Initial':
+			yield pending, flag
+		yield pending, 'Terminal'
+		pending.clear()
@@ -30,7 +30,10 @@ import time
 import ast
 import tkMessageBox
 from Helpers import *
-import xml.etree.ElementTree as ET
+from ItsReader import Ingest, Forget
+import EventCache
+import Manifest
+import Transitions
 import csv
 
 MAC = 'Darwin'
@@ -41,9 +44,7 @@ ABC = 'AB_C'
 ABC2 = 'A_BC'
 OK = 'ok'
 MAXTHREADS = 4
-codes = ['MAN','MAF','FAN','FAF','CHNSP','CHNNSP', \
-			'CHF','CXN','CXF','NON','NOF','OLN','OLF','TVN', \
-			'TVF','SIL']
+codes = list(SPEAKER_CODES)
 code_use = {'MAN':False,'MAF':False,'FAN':False,'FAF':False,'CHNSP':False,'CHNNSP':False, \
 			'CHF':False,'CXN':False,'CXF':False,'NON':False,'NOF':False,'OLN':False,'OLF':False,'TVN':False, \
 			'TVF':False,'SIL':False}
@@ -77,6 +78,8 @@ class LenaUI:
         self.keep_pauses = BooleanVar()
 	self.keep_pauses.set(True)
         self.sequence_type = StringVar()
+        self.all_seq_types = BooleanVar()
+        self.all_seq_types.set(False)
         self.var_a = []
         self.var_b = []
         self.var_c = []
@@ -85,6 +88,8 @@ class LenaUI:
         self.output_msg_counter = 0
         self.num_threads = IntVar()
         self.num_threads.set(4)
+        self.use_processes = BooleanVar()
+        self.use_processes.set(False)
         self.start_time = None
         self.seq_run_results = []
 
@@ -102,6 +107,7 @@ class LenaUI:
         file_menu = Menu(menubar) # create "File" menu item     
         file_menu.add_command(label="Instructions", command=self.load_instruction_window) # add a command to "Help" menu item
         file_menu.add_command(label="Change Thread Count", command=self.change_threads_window)
+        file_menu.add_command(label="Clear Cache", command=self.clear_cache)
         file_menu.add_command(label="Exit", command=self.close_program) # add a command to "File" menu item    
         menubar.add_cascade(label="File", menu=file_menu)   # attach "File" menu item to menubar
 
@@ -136,12 +142,26 @@ class LenaUI:
         t.wm_title("Set Threads")
         l = Label(t, text="Set number of threads to use\nwhen performing analysis: \n(default=4)")
         s = Spinbox(t, from_=4, to=50, textvariable=self.num_threads, width=4)
+        c = ttk.Checkbutton(t, text="Use separate processes", variable=self.use_processes, onvalue=True, offvalue=False)
         b = ttk.Button(t, text="close", command=lambda: t.destroy(), width=4)
 
         # arrange widgets
         l.grid(row=0, column=0, padx=5, pady=7)
         s.grid(row=1, column=0, sticky=W, padx=15, pady=5)
         b.grid(row=1,column=0, sticky=E, padx=15, pady=5)
+        c.grid(row=2, column=0, sticky=W, padx=15, pady=5)
+
+    def clear_cache(self):
+        """
+        Empties the on-disk event cache, the in-memory transition counts and the run manifests of the output
+        directory, so that every file is read from its .its file and analyzed again on the next run.
+        :return:
+        """
+        EventCache.Invalidate()
+        Forget()
+        Transitions.Clear()
+        Manifest.Invalidate(self.top_out_path.get())
+        self.write_to_window("Event cache cleared!")
 
     def change_pause_duration_up(self, event):
         """
@@ -263,21 +283,9 @@ class LenaUI:
         #Loop through files in directory
         for filename in self.file_dict:
 
-            #catch for .its files
+            #catch for .its files; labels were collected when Batch read the file
             if self.file_dict[filename].endswith('.its'):
-                tree = ET.parse(self.file_dict[filename])
-                root = tree.getroot()
-
-                #Loop through segments in file
-                for segment in root.iter('Segment'):
-                    if segment.get('spkr') != None:
-                        if segment.get('spkr') == 'CHN':
-                            if segment.get('startUtt1') != None:
-                                labels.add('CHNSP')
-                            else:
-                                labels.add('CHNNSP')
-                        else:
-                            labels.add(segment.get('spkr'))
+                labels.update(Ingest(self.file_dict[filename], events=False).labels)
 
             elif self.file_dict[filename].endswith('.csv'):
                 with open(self.file_dict[filename]) as csvFile:
@@ -324,6 +332,8 @@ class LenaUI:
         self.mid_abc_c_box.bind("<<ListboxSelect>>", self.change_abc_var)
 
         def disable_c():
+            if self.all_seq_types.get():
+                return # C is still needed by the other types
             self.mid_abc_c_box.configure(state="disable")
             self.mid_abc_c_box.update()
 
@@ -336,6 +346,8 @@ class LenaUI:
         self.mid_abc_btn = ttk.Radiobutton(self.mid_frame, text='( A ---> B ) ---> C', variable=self.sequence_type, value=ABC, command=enable_c)        
         #Added for FR-17. Changes oder of operations from (A->B)->C to A->(B->C)
         self.mid_abc2_btn = ttk.Radiobutton(self.mid_frame, text='A ---> ( B ---> C )', variable=self.sequence_type, value=ABC2, command=enable_c)
+        # computes the other two types in the same pass, as extra output columns
+        self.mid_all_types_checkbox = ttk.Checkbutton(self.mid_frame, text="Also run the other types", variable=self.all_seq_types, onvalue=True, offvalue=False, command=lambda: enable_c() if self.all_seq_types.get() or self.sequence_type.get() != AB else disable_c())
 
         mid_filler_label = ttk.Label(self.mid_frame, text="     ")
         mid_conf_label = ttk.Label(self.mid_frame, text="Configure Analysis")
@@ -381,6 +393,7 @@ class LenaUI:
         mid_pause_dn_btn.grid(row=8, column=2, sticky=E)
         mid_pause_up_btn.grid(row=8, column=3, sticky=W)
         self.mid_pause_checkbox.grid(row=9, column=0, pady=4, columnspan=4)
+        self.mid_all_types_checkbox.grid(row=10, column=0, pady=4, columnspan=4)
 
 	"""
         ## Pauses to Keep feature
@@ -483,14 +496,16 @@ class LenaUI:
         if not self.var_b:
             return "B is not set! "
 
-        # check var_c
-        if (self.sequence_type.get() == ABC or self.sequence_type.get() == ABC2):
+        # check var_c, also needed by the three-event sequences run with "Also run the other types"
+        if (self.sequence_type.get() == ABC or self.sequence_type.get() == ABC2 or self.all_seq_types.get()):
             if not self.var_c:
                 return "C is not set! "
 
         # check output_format
         if not self.output_format:
             return "Output format not set! "
+        elif ".xlsx" in self.output_format and not xlsx_available():
+            return "xlsxwriter is not installed, needed for .xlsx output! "
         else:
             self.write_to_window("All config options are valid!")
         
@@ -518,6 +533,7 @@ class LenaUI:
         self.seq_config['P'] = 'Pause'
         self.seq_config['outputDirPath'] = self.top_out_path.get()
         self.seq_config['seqType'] = self.sequence_type.get()
+        self.seq_config['allSeqTypes'] = str(self.all_seq_types.get())
         self.seq_config['PauseDur'] = str(round(self.pause_duration.get(), 1))
         self.seq_config['PauseKeep'] = str(round(self.minutes_of_pause_to_keep.get(), 1))
         self.seq_config['outputTypes'] = ''.join(self.output_format)
@@ -558,7 +574,7 @@ class LenaUI:
                 break
             elif self.stopper.is_set():
                 # alert user
-                self.write_to_window("Analysis Cancelled!")
+                self.write_to_window("Analysis Cancelled! Submit again to resume with the files not yet analyzed.")
 
                 # reset check var
                 self.seq_run_results = []
@@ -621,7 +637,8 @@ class LenaUI:
         self.btm_submit_btn.configure(text="Cancel", command=self.kill_threads)
 
         # create object to send to analysis
-        data = SeqData(self.file_dict, self.seq_config, self.num_threads.get(), self.output_format)
+        backend = PROCESS_BACKEND if self.use_processes.get() else THREAD_BACKEND
+        data = SeqData(self.file_dict, self.seq_config, self.num_threads.get(), self.output_format, backend)
         self.seq_run_results = []
 
         # kick off analysis 
@@ -656,57 +673,7 @@ class LenaUI:
         
         # check contents
         try:
-            # check batDir
-            if(len(new_config['batDir']) < 2):
-                raise Exception("batDir invalid")
-            
-            # check outputDir
-            if(len(new_config['outputDirPath']) < 2):
-                raise Exception("Invalid outputDirPath!")
-
-            # check SeqType
-            if new_config['seqType'] == AB:
-                pass
-            elif new_config['seqType'] == ABC:
-                pass
-            elif new_config['seqType'] == ABC2:
-                pass
-            else:
-                raise Exception("seqType Invalid")
-            
-            # check A
-            if not any(x in codes for x in new_config['A'].split(',')):
-                raise Exception("Invalid Var A")
-
-            # check B
-            if not any(x in codes for x in new_config['B'].split(',')):
-                raise Exception("Invalid Var B")
-
-            # check C
-            if(new_config['seqType'] == ABC or new_config['seqType'] == ABC2):
-                if not any(x in codes for x in new_config['C'].split(',')):
-                    raise Exception("Invalid Var C")
-
-            # check rounding enabled
-            if new_config['roundingEnabled'] == 'True':
-                pass
-            elif new_config['roundingEnabled'] == 'False':
-                pass
-            else:
-                raise Exception("Invalid roundingEnabled!")
-
-            # check pause
-            #if(new_config['Pause'] != 'Pause'):
-            #    raise Exception("Invalid P")
-
-            # check pause duration
-            if(float(new_config['PauseDur']) < 0.1 ):
-                raise Exception("Invalid pause duration!")
-
-            # check output formats
-            if not any(x in new_config['outputTypes'] for x in ['csv', 'xlsx', 'txt']):
-                raise Exception("Invalid output types!")
-            
+            validate_config(new_config)
         except Exception as e:
             self.write_to_window("FAILURE! Invalid file contents!")
             print(repr(e))
@@ -732,17 +699,21 @@ class LenaUI:
 
             self.seq_config['seqType'] = new_config['seqType']        
 
+            self.seq_config['allSeqTypes'] = new_config.get('allSeqTypes', 'False')
+
+            # lag profile, pattern list, time bin and interval options have no widgets and are only set from config
+            # files
+            self.seq_config['maxLag'] = new_config.get('maxLag', '0')
+            self.seq_config['lagPattern'] = new_config.get('lagPattern', '')
+            self.seq_config['patterns'] = new_config.get('patterns', [])
+            self.seq_config['binWidth'] = new_config.get('binWidth', '0')
+            self.seq_config['clockBins'] = new_config.get('clockBins', 'False')
+            self.seq_config['intervals'] = new_config.get('intervals', [])
+
             self.seq_config['PauseDur'] = new_config['PauseDur']            
 
             self.seq_config['outputTypes'] = new_config['outputTypes']
-            self.output_format = []
-
-            if 'xlsx' in new_config['outputTypes']:
-                self.output_format.append(".xlsx")               
-            if 'csv' in new_config['outputTypes']:
-                self.output_format.append(".csv")                
-            if 'txt' in new_config['outputTypes']:
-                self.output_format.append(".txt")
+            self.output_format = output_formats(new_config)
                 
             self.seq_config['outputContent'] = ""
             self.seq_config['P'] = 'Pause'
@@ -778,6 +749,7 @@ class LenaUI:
 
             # sequence type
             self.sequence_type.set(new_config['seqType'])
+            self.all_seq_types.set(new_config.get('allSeqTypes', 'False') == 'True')
             
             # var_a/b/c
             #self.mid_abc_a_box
@@ -793,7 +765,7 @@ class LenaUI:
                 self.var_b.append(item)
 
             #self.mid_abc_c_box
-            if (new_config['seqType'] == ABC or new_config['seqType'] == ABC2):
+            if (new_config['seqType'] == ABC or new_config['seqType'] == ABC2 or (self.all_seq_types.get() and new_config['C'])):
                 var_c_list = new_config['C'].split(',')
                 for item in var_c_list:
                     self.mid_abc_c_box.select_set(codes_index[item])
@@ -857,6 +829,11 @@ class LenaUI:
         self.xl_var.set(0)
         self.rounding_enabled.set(0)
         self.keep_pauses.set(1)
+        self.all_seq_types.set(False)
+
+        # drop the options that have no widgets and are only set from config files
+        for key in ('maxLag', 'lagPattern', 'patterns', 'binWidth', 'clockBins', 'intervals'):
+            self.seq_config.pop(key, None)
 
         # re-initialize the selections update
         self.top_csv_btn.configure(variable=self.csv_var)
@@ -0,0 +1,231 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Run manifest kept in the output directory, so that a rerun of the same analysis over a directory only analyses the
+files that are new or changed since the last run, and takes the results of the others from the manifest.
+
+A manifest is a JSON file holding, for every file analysed, its path, subject ID, size, modification time,
+content hash and result rows. Its name contains a hash of the configuration (everything but the output settings),
+so each analysis has its own manifest and a change of any setting starts from scratch. A file whose size and
+modification time are unchanged is taken as unchanged; one whose modification time changed but whose content
+hash did not, e.g. after being copied again from the recorder, is too.
+
+The manifest itself is written at the end of a run. Until then, the entry of every file is appended to a journal
+as soon as the file is done, so a run that is cancelled, or dies with the machine, is resumed by running it again:
+the journal is replayed onto the manifest and only the files not yet done are analysed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from ItsReader import FileStamp
+
+VERSION = 2
+PREFIX = 'LC2-manifest-'
+EXT = '.json'
+JOURNAL_EXT = '.journal'
+
+# settings that only decide where and in which formats results are written, not what they are
+OUTPUT_KEYS = ('outputDirPath', 'outputTypes', 'outputContent')
+
+def ConfigKey(varMap, sweep):
+	"""
+	Returns the hash of the settings that decide the results of an analysis.
+	:param varMap:
+	:param sweep: dict of swept setting -> list of values, or None
+	:return hex string:
+	"""
+	settings = dict((k, v) for k, v in varMap.items() if k not in OUTPUT_KEYS)
+	if settings.get('batDir'):
+		settings['batDir'] = os.path.abspath(settings['batDir'])
+	text = json.dumps([VERSION, settings, sweep], sort_keys=True)
+	return hashlib.sha1(text).hexdigest()
+
+def FileHash(path):
+	"""
+	Returns the SHA-1 of the contents of a file.
+	:param path:
+	:return hex string:
+	"""
+	h = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), ''):
+			h.update(block)
+	return h.hexdigest()
+
+class Manifest:
+	"""
+	The results of earlier runs of one analysis, by file.
+	"""
+	def __init__(self, outputDir, key):
+		"""
+		Loads the manifest of the analysis with configuration hash key from outputDir, if there is one.
+		:param outputDir:
+		:param key: ConfigKey() of the analysis
+		"""
+		self.path = os.path.join(outputDir, PREFIX + key[:16] + EXT)
+		self.journalPath = os.path.join(outputDir, PREFIX + key[:16] + JOURNAL_EXT)
+		self.journal = None # journal file, opened by the first Record()
+		self.key = key
+		self.entries = {} # key:absolute path, value:dict of pID, size, mtime, hash, header and rows
+		self.stamps = {} # key:absolute path, value:(size, mtime) when the file was found new or changed
+		self.lock = threading.Lock()
+		self.Load()
+
+	def Load(self):
+		"""
+		Reads the manifest file and replays the journal of an unfinished run onto it. A missing, unreadable or
+		outdated manifest leaves the manifest empty.
+		:return:
+		"""
+		if os.path.exists(self.path):
+			try:
+				with open(self.path, 'r') as f:
+					data = json.load(f)
+				if data.get('version') == VERSION and data.get('config') == self.key:
+					self.entries = data['files']
+			except (IOError, ValueError, KeyError, AttributeError) as e:
+				print '+++ Could not read run manifest ' + self.path + ': ' + str(e)
+
+		if os.path.exists(self.journalPath):
+			try:
+				with open(self.journalPath, 'r') as f:
+					for line in f:
+						try:
+							entry = json.loads(line)
+							self.entries[entry.pop('path')] = entry
+						except (ValueError, KeyError, AttributeError):
+							pass # a line cut short by a crash
+			except IOError as e:
+				print '+++ Could not read run journal ' + self.journalPath + ': ' + str(e)
+
+	def Lookup(self, pID, path):
+		"""
+		Returns the results of a file from an earlier run if the file is unchanged since, and otherwise notes its
+		current size and modification time for Record().
+		:param pID:
+		:param path:
+		:return tuple of the list of headings and the list of result rows, or None:
+		"""
+		path = os.path.abspath(path)
+		try:
+			stamp = FileStamp(path)
+		except OSError:
+			return None # reported as an error by the analysis
+		with self.lock:
+			entry = self.entries.get(path)
+			self.stamps[path] = stamp
+		if entry is None or entry['pID'] != pID or entry['size'] != stamp[0]:
+			return None
+		if entry['mtime'] != stamp[1]:
+			try:
+				if FileHash(path) != entry['hash']:
+					return None
+			except IOError:
+				return None
+			entry['mtime'] = stamp[1]
+		return _Fields(entry['header']), [_Fields(row) for row in entry['rows']]
+
+	def Record(self, pID, path, header, rows):
+		"""
+		Stores the results of a file analysed in this run and appends them to the journal. They are not stored if
+		the file changed while it was being analysed, so it is analysed again by the next run.
+		:param pID:
+		:param path:
+		:param header: list of headings
+		:param rows: list of result rows
+		:return:
+		"""
+		path = os.path.abspath(path)
+		try:
+			digest = FileHash(path)
+			stamp = FileStamp(path)
+		except (IOError, OSError):
+			return
+		with self.lock:
+			if self.stamps.get(path, stamp) != stamp:
+				return
+			entry = {'pID':pID, 'size':stamp[0], 'mtime':stamp[1], 'hash':digest, 'header':header, 'rows':rows}
+			self.entries[path] = entry
+			try:
+				if self.journal is None:
+					self.journal = open(self.journalPath, 'a')
+				self.journal.write(json.dumps(dict(entry, path=path)) + '\n')
+				self.journal.flush()
+				os.fsync(self.journal.fileno())
+			except (IOError, OSError) as e:
+				print '+++ Could not write run journal ' + self.journalPath + ': ' + str(e)
+
+	def Save(self, paths):
+		"""
+		Writes the manifest with the entries of the given files, dropping those of files no longer analysed, and
+		removes the journal it replaces. Failures are reported but never interrupt the analysis.
+		:param paths: paths of the files of this run
+		:return:
+		"""
+		with self.lock:
+			keep = set(os.path.abspath(path) for path in paths)
+			files = dict((path, entry) for path, entry in self.entries.items() if path in keep)
+		try:
+			fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(self.path))
+			with os.fdopen(fd, 'w') as f:
+				json.dump({'version':VERSION, 'config':self.key, 'files':files}, f)
+			if os.path.exists(self.path):
+				os.remove(self.path)
+			os.rename(tmp, self.path)
+		except (IOError, OSError) as e:
+			print '+++ Could not write run manifest ' + self.path + ': ' + str(e)
+			return
+
+		# everything in the journal is now in the manifest
+		with self.lock:
+			try:
+				if self.journal is not None:
+					self.journal.close()
+					self.journal = None
+				if os.path.exists(self.journalPath):
+					os.remove(self.journalPath)
+			except (IOError, OSError) as e:
+				print '+++ Could not remove run journal ' + self.journalPath + ': ' + str(e)
+
+def _Fields(row):
+	"""
+	Returns a row read back from JSON with its strings as utf-8 byte strings, like the rest of the analysis uses;
+	numbers come back as they were stored.
+	:param row: list of fields
+	:return list of fields:
+	"""
+	return [field.encode('utf-8') if isinstance(field, unicode) else field for field in row]
+
+def Invalidate(outputDir):
+	"""
+	Removes the manifests and journals of every analysis from an output directory, so that the next run analyses
+	every file.
+	:param outputDir:
+	:return:
+	"""
+	if not os.path.isdir(outputDir):
+		return
+	for f in os.listdir(outputDir):
+		if f.startswith(PREFIX) and (f.endswith(EXT) or f.endswith(JOURNAL_EXT)):
+			try:
+				os.remove(os.path.join(outputDir, f))
+			except OSError:
+				pass
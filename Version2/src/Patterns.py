@@ -0,0 +1,130 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Antecedent -> consequent patterns of any length, counted at any lag.
+
+A pattern is written as its antecedent elements, "->", and its consequent elements, separated by spaces, e.g.
+"A -> B", "A B -> C" or "A B C -> D". An element is an event type of the configuration (A, B, C or P) or a
+'+'-joined list of speakers such as "MAN+FAN". At lag k the consequent starts k events after the last antecedent
+event, so lag 1 is the usual adjacent sequence and "A -> B" at lag 1 is the A_B analysis.
+"""
+
+from Transitions import NumPy
+
+# the pattern of each sequence type of the standard analysis
+SEQ_TYPE_PATTERNS = {'A_B': 'A -> B', 'AB_C': 'A B -> C', 'A_BC': 'A -> B C'}
+
+def ParsePattern(spec):
+	"""
+	Splits a pattern into its antecedent and consequent elements.
+	:param spec: pattern string, e.g. "A B -> C"
+	:return tuple of the antecedent and consequent element lists:
+	"""
+	if spec.count('->') != 1:
+		raise ValueError('Pattern needs one "->" between antecedent and consequent: ' + spec)
+	antecedent, consequent = [part.split() for part in spec.split('->')]
+	if len(antecedent) == 0 or len(consequent) == 0:
+		raise ValueError('Pattern needs an antecedent and a consequent: ' + spec)
+	return antecedent, consequent
+
+def LagTables(codes, antecedent, consequent, maxLag):
+	"""
+	Counts the 2x2 contingency table of a pattern at every lag from 1 to maxLag.
+
+	Both halves of the pattern are matched once over the code sequence. The table at lag k then pairs each
+	window's antecedent match with the consequent match k events further on, over every window of the sequence
+	that is long enough for that lag.
+
+	:param codes: sequence of speaker codes (array('H'))
+	:param antecedent: for each antecedent element, the membership of each speaker code in it
+	:param consequent: for each consequent element, the membership of each speaker code in it
+	:param maxLag:
+	:return list of dicts of the a/b/c/d cells, for lags 1 to maxLag:
+	"""
+	m = len(antecedent)
+	numpy = NumPy()
+	if len(codes) > 0 and numpy is not None:
+		c = numpy.frombuffer(codes, dtype=numpy.uint16)
+		ends = _MatchNumPy(c, antecedent)
+		starts = _MatchNumPy(c, consequent)
+		count = lambda flags: int(numpy.count_nonzero(flags))
+		both = [0]
+		for k in range(1, maxLag + 1):
+			windows = Windows(len(starts), m, k)
+			both.append(count(ends[:windows] & starts[m - 1 + k:m - 1 + k + windows]))
+	else:
+		ends = _Match(codes, antecedent)
+		starts = _Match(codes, consequent)
+		count = lambda flags: flags.count('\x01')
+		# one pass over the consequent matches, looking back at the antecedent match of every lag
+		both = [0] * (maxLag + 1)
+		for q in xrange(len(starts)):
+			if starts[q]:
+				for k in range(1, maxLag + 1):
+					i = q - (m - 1) - k
+					if i < 0:
+						break
+					if ends[i]:
+						both[k] += 1
+
+	tables = []
+	for k in range(1, maxLag + 1):
+		windows = Windows(len(starts), m, k)
+		numCurr = count(ends[:windows])
+		numNext = count(starts[m - 1 + k:m - 1 + k + windows])
+		tables.append({"a":both[k], "b":numCurr - both[k], "c":numNext - both[k],
+			"d":windows - numCurr - numNext + both[k]})
+	return tables
+
+def Windows(numStarts, m, k):
+	"""
+	Returns the number of windows long enough to hold an m-event antecedent, k-1 events in between and the
+	consequent, given the number of positions the consequent can start at.
+	:param numStarts:
+	:param m:
+	:param k:
+	:return integer number of windows:
+	"""
+	return max(0, numStarts - (m - 1) - k)
+
+def _Match(codes, members):
+	"""
+	Returns a bytearray with a 1 at every index where the elements of members match the codes starting there.
+	"""
+	w = len(members)
+	flags = bytearray(max(0, len(codes) - w + 1))
+	first = members[0]
+	for i in xrange(len(flags)):
+		if first[codes[i]]:
+			for j in range(1, w):
+				if not members[j][codes[i + j]]:
+					break
+			else:
+				flags[i] = 1
+	return flags
+
+def _MatchNumPy(codes, members):
+	"""
+	NumPy version of _Match(), returning a boolean array.
+	"""
+	numpy = NumPy()
+	length = max(0, len(codes) - len(members) + 1)
+	flags = numpy.ones(length, dtype=bool)
+	for j, member in enumerate(members):
+		flags &= numpy.array(member, dtype=bool)[codes[j:j + length]]
+	return flags
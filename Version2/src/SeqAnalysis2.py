@@ -21,20 +21,36 @@ removes and adds required pauses to the item list, performs sequence analysis, g
 calculates the ocv, and finally, logs errors.
 """
 
-import xml.etree.ElementTree as ET
-from copy import deepcopy
+from array import array
+from itertools import izip, izip_longest
 import os
 import csv
 import threading
+import multiprocessing
 import Queue
 from Helpers import *
+from ItsReader import Ingest, Release, EventStream, FileStamp, IterEvents, RecordingClock, ClockLabel, STREAM_MIN_BYTES
+import Transitions
+import Patterns
+import Manifest
 import math
 
+# number of events StreamAnalysis() collects before counting them as one block
+STREAM_BLOCK = 65536
+
+# bit of each event type in the speaker class masks built by EItemList.ClassMasks()
+CLASS_BITS = {"A":1, "B":2, "C":4, "P":8}
+
+# sequence types computed together when allSeqTypes is enabled
+SEQ_TYPES = ['A_B', 'AB_C', 'A_BC']
+
 # Event Item
-class EItem:
+class EItem(object):
 	"""
 	Event Item Object class
 	"""
+	__slots__ = ('spkr', 'onset', 'offset')
+
 	def __init__(self, spkr, onset, offset):
 		"""
 		Initializes the event item with an xml attribute.
@@ -45,6 +61,37 @@ class EItem:
 		self.offset = offset
 
 
+# Pause Runs
+class PauseRuns:
+	"""
+	Run-length form of the pauses of an EItemList. counts[i] pauses precede event i; they start at starts[i] and
+	follow each other every PauseDur seconds, the last one ending no later than ends[i]. The extra last run holds
+	the pauses after the last event. Gaps are kept as one number each, so memory does not grow with the length of
+	the silences.
+	"""
+	def __init__(self):
+		"""
+		Initializes an empty set of runs.
+		"""
+		self.counts = array('L')
+		self.starts = array('d')
+		self.ends = array('d')
+		self.total = 0
+
+	def Append(self, count, start, end):
+		"""
+		Adds the run of pauses preceding the next event, or following the last one.
+
+		:param count: number of pauses
+		:param start: start of the first pause
+		:param end: end of the gap the pauses fill
+		:return:
+		"""
+		self.counts.append(count)
+		self.starts.append(start)
+		self.ends.append(end)
+		self.total += count
+
 # Event Item List
 class EItemList:
 	"""
@@ -59,20 +106,102 @@ class EItemList:
 		:param pid:
 		:param filename:
 		"""
-		self.list = []
-		self.list_ = []
+		self.events = EventStream() # speaker codes plus parallel onset/offset arrays
+		self.pauseCode = self.events.Code("Pause")
+		self.pauses = None # PauseRuns preceding the events once InsertPauses() ran, None while written out
+		self.transitions = None # TransitionCounts of the sequence, see CountTransitions()
 		self._varMap = _varMap
 		self.seqType = self._varMap["seqType"]
 		self.pid = pid
 		self.filename = filename
-		self.relevantSpkrs = self._varMap["A"]+','+self._varMap["B"]+','+self._varMap["C"]+',Pause'
+		self.evTypes = ["A","B","C","P"]
+		# exact speaker set of each event type, e.g. "MAN,FAN" -> set(['MAN', 'FAN'])
+		self.spkrClasses = dict((e, self.SpeakerSet(self._varMap[e])) for e in self.evTypes)
+		self.relevantSpkrs = self.spkrClasses["A"] | self.spkrClasses["B"] | self.spkrClasses["C"] | set(["Pause"])
+		self.classMasks = [] # speaker code -> bitmask of CLASS_BITS, extended by ClassMasks()
 		self.pauseDur = float(self._varMap["PauseDur"])
 		self.pauseKeep = float(self._varMap["PauseKeep"])
 		self.keepAllPauses = True if "1" in self._varMap["keepAllPauses"] else False
 		self.eventCnt = {"A":0,"B":0,"C":0,"P":0}
-		self.evTypes = ["A","B","C","P"]
 		self.contingencies = {"a":0, "b":0, "c":0, "d":0}
 		self.round = True if "1" in self._varMap["roundingEnabled"] else False
+		# with allSeqTypes the other sequence types are computed in the same pass and added as extra columns
+		self.allSeqTypes = str(self._varMap.get("allSeqTypes", "False")) in ("True", "1")
+		self.seqTypes = [self.seqType]
+		if self.allSeqTypes:
+			self.seqTypes += [t for t in SEQ_TYPES if t != self.seqType]
+		self.tables = dict((t, {"a":0, "b":0, "c":0, "d":0}) for t in self.seqTypes)
+		self.tables[self.seqType] = self.contingencies
+		# with maxLag the lagPattern (by default the pattern of seqType) is also counted at lags 1 to maxLag
+		self.maxLag = int(self._varMap.get("maxLag", "0") or 0)
+		self.lagPattern = self._varMap.get("lagPattern") or Patterns.SEQ_TYPE_PATTERNS.get(self.seqType, 'A -> B')
+		self.lagTables = []
+		# with binWidth (minutes) the transitions are also counted per block of the recording, measured from its start
+		# or, with clockBins, from midnight of the day it started by the local clock, see CountBins()
+		self.binWidth = float(self._varMap.get("binWidth", "0") or 0) * 60
+		self.clockBins = str(self._varMap.get("clockBins", "False")) in ("True", "1")
+		self.bins = {} # bin index -> TransitionCounts of the transitions ending in that bin
+		self.binOrigin = 0 # start of bin 0, in seconds from the start of the file or, with clockBins, local clock time
+		self.clock = None # RecordingClock of an .its file, set by the analysis
+
+	def SpeakerSet(self, spkrs):
+		"""
+		Splits a comma separated list of speakers into a set.
+		:param spkrs:
+		:return set of speaker strings:
+		"""
+		return set(s.strip() for s in spkrs.split(',') if s.strip())
+
+	def ClassMasks(self):
+		"""
+		Returns the bitmask of event types (see CLASS_BITS) each speaker code belongs to, indexed by code.
+		The table is built once and only extended for speakers interned since the last call.
+		:return list of integer bitmasks:
+		"""
+		for spkr in self.events.spkrs[len(self.classMasks):]:
+			self.classMasks.append(self.SpeakerMask(spkr))
+		return self.classMasks
+
+	def SpeakerMask(self, spkr):
+		"""
+		Returns the bitmask of event types a speaker belongs to.
+		:param spkr:
+		:return integer bitmask of CLASS_BITS:
+		"""
+		mask = 0
+		for e in self.evTypes:
+			if spkr in self.spkrClasses[e]:
+				mask |= CLASS_BITS[e]
+		return mask
+
+	def Membership(self, masks, e):
+		"""
+		Returns, for each speaker code, whether it belongs to event type e.
+		:param masks: speaker code -> bitmask, as returned by ClassMasks()
+		:param e: "A", "B", "C" or "P"
+		:return list of booleans indexed by code:
+		"""
+		return [bool(mask & CLASS_BITS[e]) for mask in masks]
+
+	def ElementMembership(self, element):
+		"""
+		Returns, for each speaker code, whether it belongs to a pattern element: an event type (A, B, C or P) or a
+		'+'-joined list of speakers. Speakers outside A, B and C are not in the event list, so they never match.
+		:param element:
+		:return list of booleans indexed by code:
+		"""
+		if element in self.evTypes:
+			return self.Membership(self.ClassMasks(), element)
+		spkrs = set(element.split('+'))
+		return [spkr in spkrs for spkr in self.events.spkrs]
+
+	def SelectionKey(self):
+		"""
+		Returns the settings that decide which events end up in the pause-expanded sequence: the relevant speakers
+		and the pause options. Lists with equal keys built from the same file have identical sequences.
+		:return hashable tuple:
+		"""
+		return (frozenset(self.relevantSpkrs), self.pauseDur, self.pauseKeep, self.keepAllPauses, self.round)
 
 	def AddEItem(self, seg, flag=None):
 		"""
@@ -88,11 +217,50 @@ class EItemList:
 		if 'CHN' in seg.attrib["spkr"]:
 			seg.attrib["spkr"] = self.Modify_CHN_Events(seg)
 
+		self.AddEvent(seg.attrib["spkr"], float(seg.attrib["startTime"][2:-1]), float(seg.attrib["endTime"][2:-1]), flag)
+
+	def AddEvent(self, spkr, onset, offset, flag=None):
+		"""
+		Adds an already extracted event to the event item list. Flag is for signaling terminal or initial event of
+		the file.
+
+		:param spkr:
+		:param onset:
+		:param offset:
+		:param flag:
+		:return:
+		"""
 		# Handle first and last events in .its file if they aren't relevant speakers
-		if (flag is 'Initial' or flag is 'Terminal') and seg.attrib["spkr"] not in self.relevantSpkrs:
-			seg.attrib["spkr"]="Pause"
-		if seg.attrib["spkr"] in self.relevantSpkrs:
-			self.list.append( EItem(seg.attrib["spkr"], float(seg.attrib["startTime"][2:-1]), float(seg.attrib["endTime"][2:-1])) )
+		if (flag == 'Initial' or flag == 'Terminal') and spkr not in self.relevantSpkrs:
+			spkr = "Pause"
+		if spkr in self.relevantSpkrs:
+			self.events.Append(spkr, onset, offset)
+
+	def AddEvents(self, events):
+		"""
+		Adds every event of an ItsReader.EventStream to the event item list, flagging the first and last ones.
+
+		:param events:
+		:return:
+		"""
+		for code, onset, offset in self.SelectEvents(FlagEnds(events)):
+			self.events.AppendCode(code, onset, offset)
+
+	def SelectEvents(self, events):
+		"""
+		Yields the events of the relevant speakers as (code, onset, offset) tuples, the way AddEvent() keeps them.
+
+		:param events: iterable of (speaker, onset, offset, flag) tuples, see FlagEnds()
+		:return generator of (code, onset, offset) tuples:
+		"""
+		relevant = self.relevantSpkrs
+		Code = self.events.Code
+		for spkr, onset, offset, flag in events:
+			# Handle first and last events in .its file if they aren't relevant speakers
+			if (flag == 'Initial' or flag == 'Terminal') and spkr not in relevant:
+				spkr = "Pause"
+			if spkr in relevant:
+				yield Code(spkr), onset, offset
 
 	def AddEItemCSV(self, data_array, flag=None):
 		"""
@@ -105,7 +273,7 @@ class EItemList:
 			onsetTS = data_array[0].split(':')
 			onset = int(onsetTS[0])*60*60 + int(onsetTS[1])*60 + int(onsetTS[2]) + int(onsetTS[3])/100
 			offset = onset
-			self.list.append( EItem(data_array[1], onset, offset) )
+			self.events.Append(data_array[1], onset, offset)
 
 	def Modify_CHN_Events(self, seg):
 		"""
@@ -120,12 +288,28 @@ class EItemList:
 			CHN_mod = 'CHNNSP'
 		return CHN_mod
 
+	def UseEvents(self, events):
+		"""
+		Makes the list work on an event stream that was filled by another list with the same relevant speakers,
+		e.g. by a parameter sweep that reads each file once. The stream itself is never modified.
+
+		:param events: EventStream
+		:return:
+		"""
+		self.events = events
+		self.pauseCode = events.Code("Pause")
+		self.classMasks = []
+		self.pauses = None
+		self.transitions = None
+
 	def Size(self):
 		"""
-		Returns current size of the Event item list.
+		Returns current size of the Event item list, pauses included.
 		:return the current integer length of the event item list:
 		"""
-		return len(self.list)
+		if self.pauses is not None:
+			return self.events.Size() + self.pauses.total
+		return self.events.Size()
 
 	def GetItem(self, index):
 		"""
@@ -133,7 +317,9 @@ class EItemList:
 		:param index:
 		:return Event item from the event item list:
 		"""
-		return self.list[index]
+		self.Expand()
+		ev = self.events
+		return EItem(ev.spkrs[ev.codes[index]], ev.onsets[index], ev.offsets[index])
 
 	def RemoveExtraneousPauses(self):
 		"""
@@ -142,86 +328,316 @@ class EItemList:
 		then 1 minute of pauses will be removed
 		:return:
 		"""
-		
+		ev = self.events
+		if self.pauses is not None:
+			runs = self.pauses
+			self.CollectRuns(self.TrimRuns(izip_longest(ev.codes, ev.onsets, ev.offsets, runs.counts, runs.starts,
+				runs.ends)))
+			return
+
 		timeOfContiguousPauses = 0.0
-		unwantedPauses = []
+		numRemoved = 0
 		secondsToKeep = int(self.pauseKeep * 60)
+		kept = ev.Derive()
 
-		for item in self.list:
+		for code, onset, offset in izip(ev.codes, ev.onsets, ev.offsets):
 			
-			if (item.spkr != 'Pause'):
+			if (code != self.pauseCode):
 				timeOfContiguousPauses = 0.0
 
-			if (item.spkr == 'Pause'):
-				timeOfContiguousPauses += (item.offset - item.onset)
+			if (code == self.pauseCode):
+				timeOfContiguousPauses += (offset - onset)
+
+			if (timeOfContiguousPauses > secondsToKeep) and (code == self.pauseCode):
+				numRemoved += 1
+			else:
+				kept.AppendCode(code, onset, offset)
+
+		print '+++ Num pauses removed = ' + str(numRemoved)
+		self.pausesRemoved = numRemoved
+		self.events = kept
+		self.transitions = None
+
+	def TrimRuns(self, items):
+		"""
+		Leaves out the contiguous pauses past the amount to keep from a stream of events with run-length pauses, as
+		RemoveExtraneousPauses() does on a list. Each run is only walked up to the point where the limit is passed.
+		The number of pauses left out is stored in self.pausesRemoved once the stream is used up.
+
+		:param items: iterable of (code, onset, offset, count, start, end) tuples, see GapRuns()
+		:return generator of (code, onset, offset, count, start, end) tuples:
+		"""
+		timeOfContiguousPauses = 0.0
+		numRemoved = 0
+		secondsToKeep = int(self.pauseKeep * 60)
+		P = self.pauseDur
+		pauseCode = self.pauseCode
+		run = (0, 0.0, 0.0) # kept pauses waiting for the next kept event
+		for code, onset, offset, count, start, end in items:
+			for j in xrange(count):
+				startTime = start+(j*P)
+				timeOfContiguousPauses += (min(end,startTime+P) - startTime)
+				if timeOfContiguousPauses > secondsToKeep:
+					# pauses only add time, so the rest of the run is past the limit as well
+					numRemoved += count - j
+					count = j
+					break
+			if count:
+				run = (count, start, end)
+			if code is None:
+				# pauses after the last event
+				yield (None, None, None) + run
+				break
+
+			if (code != pauseCode):
+				timeOfContiguousPauses = 0.0
+			else:
+				timeOfContiguousPauses += (offset - onset)
+				if timeOfContiguousPauses > secondsToKeep:
+					numRemoved += 1
+					continue
+			yield (code, onset, offset) + run
+			run = (0, 0.0, 0.0)
 
-			if (timeOfContiguousPauses > secondsToKeep) and (item.spkr == 'Pause'):
-				unwantedPauses.append(item)
+		print '+++ Num pauses removed = ' + str(numRemoved)
+		self.pausesRemoved = numRemoved
 
-		print '+++ Num pauses removed = ' + str(len(unwantedPauses))
-		for pause in unwantedPauses:
-			self.list.remove(pause)	
+	def PauseCount(self, eT, CSV = False):
+		"""
+		Returns the number of pauses to insert in a gap of eT seconds between two events.
+		:param eT:
+		:param CSV:
+		:return integer number of pauses:
+		"""
+		P = self.pauseDur
+		if (not CSV and eT >= P) or (CSV and eT > P):
+			try:
+				if CSV:
+					return int( (eT/P) )
+				elif self.round is True:
+					return int( (eT / P) + .5 )
+				else:
+					return int( (float(eT) / float(P)) )
+			except ZeroDivisionError:
+				return 0
+		return 0
 
-	def InsertPauses(self, CSV = False):
+	def InsertPauses(self, CSV = False, trim = False):
 		"""
 		Inserts pauses into the event item list.
 		Specifies the size of the ouases from the slider in the UI.
+		The pauses of each gap are stored as a run length (see PauseRuns) rather than one event each; Expand()
+		writes them out when a consumer needs every pause as an event.
+		With trim, contiguous pauses past the amount to keep are left out (see RemoveExtraneousPauses).
 		:return:
 		"""
-		self.list_.append(deepcopy(self.list[0]))
-		for i in range(1,self.Size()):
-			#determine whether to add pause before copying event
-			P = self.pauseDur
-			curEvT = self.list[i].onset
-			preEvT = self.list[i - 1].offset
-			eT = curEvT - preEvT
-
-			if (not CSV and eT >= P) or (CSV and eT > P):
-				# calculate number of pauses to insert
-				numP = 0
-				if not CSV:
-					if self.round is True:
-						try:
-							numP = int( (eT / P) + .5 )
-						except ZeroDivisionError:
-							numP = 0
-					else:
-						try:
-							numP = int( (float(eT) / float(P)) )
-						except ZeroDivisionError:
-							numP = 0
-				else:
-					try:
-						numP = int( (eT/P) )
-					except:
-						numP = 0
-
-				for j in range(0,numP):
-					# insert pause
-					startTime = preEvT+(j*P)
-					endTime = min(curEvT,startTime+P)
-					self.list_.append( EItem("Pause", startTime, endTime) )
-			#add current event
-			self.list_.append( deepcopy(self.list[i]) )
-
-		#free memory used by interim list
-		self.list = deepcopy(self.list_)
-		self.list_ = None
+		self.Expand()
+		ev = self.events
+		items = self.GapRuns(izip(ev.codes, ev.onsets, ev.offsets), CSV)
+		if trim:
+			items = self.TrimRuns(items)
+		self.CollectRuns(items)
+
+	def GapRuns(self, events, CSV = False):
+		"""
+		Yields each event with the run of pauses that fills the gap before it, followed by an empty run after the
+		last event (code None). Raises ValueError if there are no events.
+
+		:param events: iterable of (code, onset, offset) tuples
+		:param CSV:
+		:return generator of (code, onset, offset, count, start, end) tuples:
+		"""
+		preEvT = None
+		for code, onset, offset in events:
+			#determine how many pauses go before the event
+			if preEvT is None:
+				yield code, onset, offset, 0, 0.0, 0.0
+			else:
+				yield code, onset, offset, self.PauseCount(onset - preEvT, CSV), preEvT, onset
+			preEvT = offset
+		if preEvT is None:
+			raise ValueError('No events to analyse in ' + self.filename)
+		yield None, None, None, 0, 0.0, 0.0
+
+	def CollectRuns(self, items):
+		"""
+		Makes a stream of events with run-length pauses the content of the list.
+
+		:param items: iterable of (code, onset, offset, count, start, end) tuples, see GapRuns()
+		:return:
+		"""
+		events = self.events.Derive()
+		runs = PauseRuns()
+		for code, onset, offset, count, start, end in items:
+			runs.Append(count, start, end)
+			if code is not None:
+				events.AppendCode(code, onset, offset)
+		self.events = events
+		self.pauses = runs
+		self.transitions = None
+
+	def StreamAnalysis(self, events, CSV = False):
+		"""
+		Runs the whole analysis on an event iterator in one pass, in place of filling the list and calling
+		InsertPauses(), TallyItems() and SeqAn(): relevant speakers are picked out, pauses are counted per gap and
+		trimmed, and the events go into the transition counts a block of STREAM_BLOCK at a time. Only the current
+		block is held, so memory does not grow with the length of the recording.
+
+		:param events: iterable of (speaker, onset, offset) tuples, e.g. ItsReader.IterEvents()
+		:param CSV: whether the events came from a .csv file
+		:return:
+		"""
+		# intern every relevant speaker up front so the transition tables have their final size
+		for spkr in sorted(self.relevantSpkrs):
+			self.events.Code(spkr)
+		items = self.GapRuns(self.SelectEvents(FlagEnds(events)), CSV)
+		if not self.keepAllPauses:
+			items = self.TrimRuns(items)
+		if self.binWidth:
+			items = self.CountBins(items)
+
+		counts = Transitions.TransitionCounts(self.events.spkrs, pauseCode=self.pauseCode)
+		codes = array('H')
+		runs = array('L')
+		for code, onset, offset, count, start, end in items:
+			runs.append(count)
+			if code is not None:
+				codes.append(code)
+				if len(codes) >= STREAM_BLOCK:
+					counts.CountBlock(codes, runs)
+					codes = array('H')
+					runs = array('L')
+		counts.CountBlock(codes, runs)
+
+		self.transitions = counts
+		self.ApplyTransitions(counts)
+
+	def CountBins(self, items):
+		"""
+		Counts a stream of events with run-length pauses into time bins of binWidth seconds from the start of the
+		recording, passing the stream on unchanged. Every event, pause included, goes to the bin of its onset, and
+		so does every transition ending with it; the bins therefore add up to the counts of the whole file.
+		With clockBins the onsets are turned into local clock times first, and the bins start at midnight of the day
+		the recording started, so that they fall on the same clock hours in every file. A run of pauses takes the
+		clock offset of its start.
+
+		:param items: iterable of (code, onset, offset, count, start, end) tuples, see GapRuns()
+		:return generator of the same tuples:
+		"""
+		W = self.binWidth
+		P = self.pauseDur
+		clock = None
+		if self.clockBins:
+			if self.clock is None:
+				raise ValueError('Clock-aligned time bins need the recording clock times of an .its file')
+			clock = self.clock
+		current = None
+		for item in items:
+			code, onset, offset, count, start, end = item
+			if clock is not None:
+				# the first recording is known once the first segment has been read
+				if not self.binOrigin:
+					self.binOrigin = clock.Midnight()
+				if count:
+					start = start + clock.Shift(start) - self.binOrigin
+				if code is not None:
+					onset = onset + clock.Shift(onset) - self.binOrigin
+			j = 0
+			while j < count:
+				# the pauses of the run that start in the same bin as pause j
+				b = int((start+(j*P)) // W)
+				k = max(j + 1, min(count, int(math.ceil(((b + 1) * W - start) / P))))
+				while k > j + 1 and int((start+((k-1)*P)) // W) != b:
+					k -= 1
+				while k < count and int((start+(k*P)) // W) == b:
+					k += 1
+				current = self.Bin(b, current)
+				current.Count(None, k - j)
+				j = k
+			if code is not None:
+				current = self.Bin(int(onset // W), current)
+				current.Count(code)
+			yield item
+
+	def Bin(self, b, current):
+		"""
+		Returns the transition counts of bin b, carrying over the last events counted in the current bin so that
+		transitions across the bin boundary are counted in bin b.
+
+		:param b: bin index
+		:param current: TransitionCounts of the bin counted last, or None
+		:return TransitionCounts:
+		"""
+		counts = self.bins.get(b)
+		if counts is None:
+			counts = Transitions.TransitionCounts(self.events.spkrs, pauseCode=self.pauseCode)
+			self.bins[b] = counts
+		if current is not None and current is not counts:
+			counts.prev2, counts.prev1 = current.prev2, current.prev1
+		return counts
+
+	def BinRuns(self):
+		"""
+		Counts the events and run-length pauses of the list into time bins, see CountBins().
+		:return:
+		"""
+		ev = self.events
+		runs = self.pauses
+		for item in self.CountBins(izip_longest(ev.codes, ev.onsets, ev.offsets, runs.counts, runs.starts,
+				runs.ends)):
+			pass
+
+	def ExpandPauses(self):
+		"""
+		Yields the events with every run of pauses written out, as (code, onset, offset) tuples.
+		:return generator of (code, onset, offset) tuples:
+		"""
+		ev = self.events
+		runs = self.pauses
+		P = self.pauseDur
+		pauseCode = self.pauseCode
+		for code, onset, offset, count, start, end in izip_longest(ev.codes, ev.onsets, ev.offsets, runs.counts,
+				runs.starts, runs.ends):
+			for j in xrange(count):
+				# insert pause
+				startTime = start+(j*P)
+				yield pauseCode, startTime, min(end,startTime+P)
+			if code is not None:
+				yield code, onset, offset
+
+	def Expand(self):
+		"""
+		Writes the run-length pauses out as Pause events, for consumers that walk the full sequence.
+		:return:
+		"""
+		if self.pauses is None:
+			return
+		expanded = self.events.Derive()
+		for code, onset, offset in self.ExpandPauses():
+			expanded.AppendCode(code, onset, offset)
+		self.events = expanded
+		self.pauses = None
 
 	def TallyItems(self):
 		"""
 		Counts up the number of each event type.
 		:return:
 		"""
-		for i in range(0, self.Size()): # iterate over Event Items
-			for e in self.evTypes:			
-				if self.list[i].spkr in self._varMap[e]:
-					self.eventCnt[e] += 1
+		# count each speaker code once, then add the counts to every event type the speaker belongs to
+		counts = [0] * len(self.events.spkrs)
+		for code in self.events.codes:
+			counts[code] += 1
+		if self.pauses is not None:
+			counts[self.pauseCode] += self.pauses.total
+		for code, mask in enumerate(self.ClassMasks()):
+			for e in self.evTypes:
+				if mask & CLASS_BITS[e]:
+					self.eventCnt[e] += counts[code]
 
 	"""def PrintList(self):
 		contentToWrite = []
 		for i in range(0, self.Size()):
-			contentToWrite.append( str(self.list[i].onset)+","+str(self.list[i].spkr) )
+			contentToWrite.append( str(self.GetItem(i).onset)+","+str(self.GetItem(i).spkr) )
 
 		f = open('/your/path/here/seq.csv', 'w') #For debugging
 		f.write('\n'.join(contentToWrite))
@@ -230,73 +646,78 @@ class EItemList:
 	def SeqAn(self):
 		"""
 		Primary the function for completed the logic of the given sequence analysis.
-		Checks the var map and decides which contingency to increment based on the chosen logical expression.
+		Counts the contingencies of every sequence type from the transition counts of the sequence (see
+		CountTransitions), which take a run of k pauses in closed form.
+		:return:
+		"""
+		print 'Analysis from transition counts in progress...'
+		self.ApplyTransitions(self.CountTransitions(), tally=False)
+
+	def LagAn(self):
+		"""
+		Counts the contingencies of lagPattern at every lag from 1 to maxLag in one pass over the event items.
 		:return:
 		"""
-		numItems = self.Size()
-		# A-->B
-		if self._varMap['seqType'] == 'A_B':
-			print 'A-->B Analysis in progress...'
-			# iterate over event items
-			for i in range(0, numItems-1):
-				curr = self.list[i]
-				next = self.list[i+1]
-				if curr.spkr in self._varMap["A"] and next.spkr in self._varMap["B"]:
-					self.contingencies["a"] += 1
-				elif curr.spkr in self._varMap["A"] and next.spkr not in self._varMap["B"]:
-					self.contingencies["b"] += 1
-				elif curr.spkr not in self._varMap["A"] and next.spkr in self._varMap["B"]:
-					self.contingencies["c"] += 1
-				elif curr.spkr not in self._varMap["A"] and next.spkr not in self._varMap["B"]:
-					self.contingencies["d"] += 1
-		# (A-->B)-->C
-		elif self._varMap['seqType'] == 'AB_C':
-			print '(A-->B)-->C Analysis in progress...'
-			# iterate over event items
-			for i in range(0, numItems-2):
-				curr = self.list[i]
-				nextB = self.list[i+1]
-				nextC = self.list[i+2]
-				if curr.spkr in self._varMap["A"] and nextB.spkr in self._varMap["B"] and nextC.spkr in self._varMap["C"]:
-					self.contingencies["a"] += 1
-				elif curr.spkr in self._varMap["A"] and nextB.spkr in self._varMap["B"] and nextC.spkr not in self._varMap["C"]:
-					self.contingencies["b"] += 1
-				elif not(curr.spkr in self._varMap["A"] and nextB.spkr in self._varMap["B"]) and nextC.spkr in self._varMap["C"]:
-					self.contingencies["c"] += 1
-				elif not(curr.spkr in self._varMap["A"] and nextB.spkr in self._varMap["B"]) and nextC.spkr not in self._varMap["C"]:
-					self.contingencies["d"] += 1
-
-		# A-->(B-->C)
-		elif self._varMap['seqType'] == 'A_BC':
-			print 'A-->(B-->C) Analysis in progress...'
-			# iterate over event items
-			for i in range(0, numItems - 2):
-				curr = self.list[i]
-				nextB = self.list[i + 1]
-				nextC = self.list[i + 2]
-				if curr.spkr in self._varMap["A"] and nextB.spkr in self._varMap["B"] and nextC.spkr in self._varMap["C"]:
-					self.contingencies["a"] += 1
-				elif curr.spkr in self._varMap["A"] and not (nextB.spkr in self._varMap["B"] and nextC.spkr in self._varMap["C"]):
-					self.contingencies["b"] += 1
-				elif curr.spkr not in self._varMap["A"] and nextB.spkr in self._varMap["B"] and nextC.spkr in self._varMap["C"]:
-					self.contingencies["c"] += 1
-				elif curr.spkr not in self._varMap["A"] and not (nextB.spkr in self._varMap["B"] and nextC.spkr in self._varMap["C"]):
-					self.contingencies["d"] += 1
+		print 'Lag 1-' + str(self.maxLag) + ' analysis of ' + self.lagPattern + ' in progress...'
+		self.Expand()
+		antecedent, consequent = Patterns.ParsePattern(self.lagPattern)
+		self.lagTables = Patterns.LagTables(self.events.codes, [self.ElementMembership(e) for e in antecedent],
+			[self.ElementMembership(e) for e in consequent], self.maxLag)
+
+	def CountTransitions(self):
+		"""
+		Counts the speaker transitions of the event sequence, see Transitions.TransitionCounts. The counts are
+		kept until pauses are inserted or removed.
+		:return TransitionCounts:
+		"""
+		if self.transitions is None:
+			runs = self.pauses.counts if self.pauses is not None else None
+			self.transitions = Transitions.TransitionCounts(self.events.spkrs, self.events.codes, runs,
+				self.pauseCode)
+		return self.transitions
+
+	def ApplyTransitions(self, counts, tally=True):
+		"""
+		Fills in the event counts and contingencies from the transition counts of this list's sequence, in place of
+		TallyItems() and SeqAn().
+		:param counts: TransitionCounts of a list with the same SelectionKey()
+		:param tally: whether to fill in the event counts too
+		:return:
+		"""
+		masks = [self.SpeakerMask(spkr) for spkr in counts.spkrs]
+		if tally:
+			for e in self.evTypes:
+				self.eventCnt[e] += counts.Tally(self.Membership(masks, e))
+		inA = self.Membership(masks, "A")
+		inB = self.Membership(masks, "B")
+		inC = self.Membership(masks, "C")
+		for seqType in self.seqTypes:
+			cells = counts.Contingencies(seqType, inA, inB, inC)
+			for cell in cells:
+				self.tables[seqType][cell] += cells[cell]
 
 	def Header(self):
 		"""
-		Assembles Headings string for output file.
-		:return string of headings for output:
+		Assembles the headings of the output columns.
+		:return list of heading strings:
 		"""
 		# Subject ID
-		h = 'PID,filename,'
-		
+		h = ['PID', 'filename']
+
 		# Event Counts
 		for e in self.evTypes:
-			h += self._varMap[e].replace(",","+") + ','
+			h.append(self._varMap[e].replace(",","+"))
 
 		# Contingencies
-		h += 'a,b,c,d,OCV'
+		h += ['a', 'b', 'c', 'd', 'OCV']
+
+		# Contingencies of the other sequence types, prefixed with their type
+		for seqType in self.seqTypes[1:]:
+			h += [seqType + '_' + x for x in ['a', 'b', 'c', 'd', 'OCV']]
+
+		# Contingencies of the lag pattern at each lag
+		for k in range(1, self.maxLag + 1):
+			h += ['lag' + str(k) + '_' + x for x in ['a', 'b', 'c', 'd', 'OCV']]
 		return h
 
 	def ResultsTuple(self):
@@ -304,21 +725,38 @@ class EItemList:
 		For result output.
 		Concatenates the contingencies, pids, filenames, OSV, and the values for A, B, C, D from the results
 		of analysis
-		:return a tuple of results:
+		:return list of result fields, counts as integers and OCVs as floats or "undefined":
 		"""
 		# Subject ID
-		rt = self.pid + ',' + self.filename.split('/')[-1] + ','
+		rt = [self.pid, self.filename.split('/')[-1]]
 
 		# Event Counts
 		for e in self.evTypes:
-			rt += str(self.eventCnt[e]) + ','
+			rt.append(self.eventCnt[e])
 
 		# Contingencies
+		rt += self.TableResults(self.contingencies)
+
+		# Contingencies of the other sequence types
+		for seqType in self.seqTypes[1:]:
+			rt += self.TableResults(self.tables[seqType])
+
+		# Contingencies of the lag pattern at each lag
+		for table in self.lagTables:
+			rt += self.TableResults(table)
+		return rt
+
+	def TableResults(self, table):
+		"""
+		Formats one contingency table and its OCV for result output.
+		:param table: dict of the a/b/c/d cells
+		:return list of the cells and the OCV:
+		"""
 		# tokens used for OCV computation
-		tok_a = float(self.contingencies["a"])
-		tok_b = float(self.contingencies["b"])
-		tok_c = float(self.contingencies["c"])
-		tok_d = float(self.contingencies["d"])
+		tok_a = float(table["a"])
+		tok_b = float(table["b"])
+		tok_c = float(table["c"])
+		tok_d = float(table["d"])
 
 		# OCV operant contingency value
 		OCV = 0
@@ -327,9 +765,378 @@ class EItemList:
 		else:
 			OCV = (tok_a / (tok_a + tok_b)) - (tok_c / (tok_c + tok_d))
 
-		rt += str(self.contingencies["a"]) + ',' + str(self.contingencies["b"]) + ',' + str(self.contingencies["c"]) + ',' + str(self.contingencies["d"]) + ',' + str(OCV)
-		return rt
+		return [table["a"], table["b"], table["c"], table["d"], OCV]
 	
+def AnalyzeFile(varMap, pID, path):
+	"""
+	Analyses one file, see AnalyzeList(). Kept at module level so that process-pool workers can run it.
+	:param varMap:
+	:param pID:
+	:param path:
+	:return tuple of the list of headings and the list of result fields:
+	"""
+	eiList = AnalyzeList(varMap, pID, path)
+	print '+++ Writing data ...'
+	return eiList.Header(), eiList.ResultsTuple()
+
+def AnalyzeList(varMap, pID, path):
+	"""
+	Initiates organizing the data for analysis.
+	Looks at the files in the path, and determines course of action for .its files or .csv files to prepare the
+	event item list based on the input file type.
+	It then calls the EItemList methods to complete analysis.
+	:param varMap:
+	:param pID:
+	:param path:
+	:return the analysed EItemList:
+	"""
+	# Announce
+	print 'Analysis in progress on pID=' + str(pID) + ', file=' + path
+
+	# Define necessary objects
+	eiList = None
+
+	# INITIALIZE ESSENTIAL OBJECTS
+	#Init event item list
+	print '+++ Generating EItemList() ...'
+	eiList = EItemList(_varMap=varMap, pid=pID, filename=path)
+	print '+++ EItemList() created successfully.'
+
+	#Transition counts of an earlier run over the same file and selection answer any grouping of its speakers,
+	#but not lags past the trigrams they hold, nor time bins
+	key = (os.path.abspath(path), FileStamp(path), eiList.SelectionKey())
+	counts = Transitions.Lookup(key) if eiList.maxLag == 0 and not eiList.binWidth else None
+	if counts is not None:
+		print '+++ Re-using transition counts of an earlier run ...'
+		eiList.ApplyTransitions(counts)
+		return eiList
+
+	if eiList.maxLag == 0 and os.path.splitext(path)[1] != '.csv':
+		#Fused pipeline: the events go from the reader through pause insertion straight into the transition counts.
+		#Very large files are read from the XML as they are analysed rather than kept as a whole.
+		if os.path.getsize(path) >= STREAM_MIN_BYTES:
+			print '+++ Streaming events from the .its file ...'
+			info = {}
+			eiList.clock = RecordingClock(info)
+			eiList.StreamAnalysis(IterEvents(path, info))
+		else:
+			record = Ingest(path)
+			eiList.clock = RecordingClock(record.clock)
+			eiList.StreamAnalysis(record.events)
+			Release(path)
+		Transitions.Store(key, eiList.CountTransitions())
+		return eiList
+
+	CSV = LoadEvents(eiList, path)
+	FinishAnalysis(eiList, CSV, key)
+	return eiList
+
+def LoadEvents(eiList, path):
+	"""
+	Fills an event item list with the events of an .its or .csv file.
+	:param eiList:
+	:param path:
+	:return True if the file was a .csv file:
+	"""
+	if os.path.splitext(path)[1] == '.csv':
+		print '+++ Processing .csv file ...'
+		f = open(path,'r')
+		rows = f.read().replace('\r','').split('\n')
+		f.close()
+		
+		csv_data = []
+		for i in range(1, len(rows)-1):
+			csv_data.append( rows[i].split(',') )
+
+		csv_arr = [csv_data[0][0], csv_data[0][1]] 
+		print '+++ Created data: ' + str(csv_arr) + ' ...'
+
+		eiList.AddEItemCSV(csv_arr, flag='Initial')
+		
+		print '+++ Iterating over rows of .csv file ...'
+		for i in range(1, len(csv_data) - 1):
+			csv_arr[0] = csv_data[i][0]
+			csv_arr[1] = csv_data[i][1]
+			eiList.AddEItemCSV(csv_arr)
+		csv_arr[0] = csv_data[-1][0]
+		csv_arr[1] = csv_data[-1][1]
+		eiList.AddEItemCSV(csv_arr, flag='Terminal')
+
+		return True
+
+	#Use the events read by the shared ingestion stage; the file is only read here if no
+	#earlier consumer (Batch, label lookup) has read it already
+	record = Ingest(path)
+	eiList.clock = RecordingClock(record.clock)
+	eiList.AddEvents(record.events)
+	Release(path)
+	return False
+
+def FinishAnalysis(eiList, CSV, key):
+	"""
+	Inserts pauses into a filled event item list, runs the analysis and caches its transition counts under key.
+	:param eiList:
+	:param CSV: whether the events came from a .csv file
+	:param key: transition cache key, see AnalyzeList()
+	:return:
+	"""
+	#Insert contiguous pauses, leaving out those past the amount to keep
+	eiList.InsertPauses(CSV = CSV, trim = not eiList.keepAllPauses)
+
+	#Count the time bins if they were asked for
+	if eiList.binWidth:
+		eiList.BinRuns()
+
+	#Tally each item in the EItemList
+	print '+++ Counting items in EItemList ...'
+	eiList.TallyItems()
+
+	#Perform primary analysis
+	print '+++ Performing sequential analysis ...'
+	eiList.SeqAn()
+
+	#Count the lag pattern if lags were asked for
+	if eiList.maxLag:
+		eiList.LagAn()
+
+	#Keep the transition counts for later runs with a different grouping of the same speakers
+	Transitions.Store(key, eiList.CountTransitions())
+
+def SweepFile(varMap, sweep, pID, path):
+	"""
+	Analyses one file at every point of a parameter sweep (see Helpers.sweep_grid). The file is read and its
+	relevant events are picked out once; every grid point then only inserts its own pauses and counts.
+	:param varMap:
+	:param sweep: dict of swept setting -> list of values
+	:param pID:
+	:param path:
+	:return tuple of the long-format headings and the list of result rows, one per grid point:
+	"""
+	print 'Sweep in progress on pID=' + str(pID) + ', file=' + path
+	stamp = FileStamp(path)
+	base = None
+	CSV = False
+	header = None
+	rows = []
+	for point in sweep_grid(sweep, varMap):
+		pointMap = dict(varMap)
+		pointMap.update(point)
+		eiList = EItemList(_varMap=pointMap, pid=pID, filename=path)
+		key = (os.path.abspath(path), stamp, eiList.SelectionKey())
+		counts = Transitions.Lookup(key) if eiList.maxLag == 0 else None
+		if counts is not None:
+			eiList.ApplyTransitions(counts)
+			h, r = eiList.Header(), eiList.ResultsTuple()
+		else:
+			# A, B and C are not swept, so the relevant events are the same at every grid point
+			if base is None:
+				base = EItemList(_varMap=pointMap, pid=pID, filename=path)
+				CSV = LoadEvents(base, path)
+			eiList.UseEvents(base.events)
+			FinishAnalysis(eiList, CSV, key)
+			h, r = eiList.Header(), eiList.ResultsTuple()
+
+		# long format: the swept settings follow the PID and file name
+		if header is None:
+			header = h[:2] + list(SWEEP_KEYS) + h[2:]
+		rows.append(r[:2] + [str(pointMap[k]) for k in SWEEP_KEYS] + r[2:])
+	return header, rows
+
+def BinFile(varMap, pID, path):
+	"""
+	Analyses one file as a whole and per time bin of varMap["binWidth"] minutes, in the same pass. Bins are
+	measured from the start of the recording, so bin 0 of every file starts at its minute 0, or, with
+	varMap["clockBins"], by the local clock from midnight of the day the recording started.
+	:param varMap:
+	:param pID:
+	:param path:
+	:return tuple of the long-format headings and the list of result rows, the whole file first:
+	"""
+	eiList = AnalyzeList(varMap, pID, path)
+	print '+++ Writing data ...'
+	width = eiList.binWidth / 60
+
+	# long format: the bin's start and end, in minutes from the start of the recording or as local clock times,
+	# follow the PID and file name
+	h = eiList.Header()
+	if eiList.clockBins:
+		header = h[:2] + ['binStartClock', 'binEndClock'] + h[2:]
+	else:
+		header = h[:2] + ['binStartFromRecStart', 'binEndFromRecStart'] + h[2:]
+	r = eiList.ResultsTuple()
+	rows = [r[:2] + ['all', 'all'] + r[2:]]
+	for b in sorted(eiList.bins):
+		binList = EItemList(_varMap=varMap, pid=pID, filename=path)
+		binList.ApplyTransitions(eiList.bins[b])
+		r = binList.ResultsTuple()
+		if eiList.clockBins:
+			W = eiList.binWidth
+			rows.append(r[:2] + [ClockLabel(eiList.binOrigin + b * W), ClockLabel(eiList.binOrigin + (b + 1) * W)]
+				+ r[2:])
+		else:
+			rows.append(r[:2] + [b * width, (b + 1) * width] + r[2:])
+	return header, rows
+
+def IntervalFile(varMap, pID, path):
+	"""
+	Analyses the intervals of one file given by varMap["intervals"] (see Helpers.file_intervals). The file's events
+	are read once and each interval is picked out of them by binary search on the onsets, so only its own events
+	are analysed. The events stay in the shared store, which keeps their onset index for later queries.
+	An interval of clock times is found in the recording from the clock times of its Recording nodes, on every day
+	the recording covers, and gives one row per such day.
+	:param varMap:
+	:param pID:
+	:param path:
+	:return tuple of the long-format headings and the list of result rows, one per interval (and day):
+	"""
+	print 'Interval analysis in progress on pID=' + str(pID) + ', file=' + path
+	CSV = os.path.splitext(path)[1] == '.csv'
+	clock = None
+	if CSV:
+		base = EItemList(_varMap=varMap, pid=pID, filename=path)
+		LoadEvents(base, path)
+		events = base.events
+	else:
+		record = Ingest(path)
+		events = record.events
+		clock = RecordingClock(record.clock)
+
+	intervals, clockTimes = file_intervals(varMap, pID, path)
+	if clockTimes and (clock is None or not clock.Recordings()):
+		raise ValueError('Clock time intervals need the recording clock times of an .its file')
+
+	# long format: the interval's start and end, in minutes from the start of the recording or as local clock times,
+	# follow the PID and file name
+	h = EItemList(_varMap=varMap, pid=pID, filename=path).Header()
+	header = h[:2] + ['intervalStart', 'intervalEnd'] + h[2:]
+	rows = []
+	for start, end in intervals:
+		if clockTimes:
+			spans = [(ClockLabel(day + start), ClockLabel(day + end), ranges)
+				for day, ranges in clock.Spans(start, end)]
+			if not spans:
+				print '+++ No recorded time between ' + ClockLabel(start)[11:] + ' and ' + ClockLabel(end)[11:]
+		else:
+			spans = [(start / 60, end / 60, [(start, end)])]
+		for first, last, ranges in spans:
+			eiList = EItemList(_varMap=varMap, pid=pID, filename=path)
+			positions = []
+			for a, b in ranges:
+				positions.extend(events.Between(a, b))
+			if len(positions):
+				eiList.StreamAnalysis(events.Events(positions), CSV)
+			r = eiList.ResultsTuple()
+			rows.append(r[:2] + [first, last] + r[2:])
+	return header, rows
+
+def MatchPatterns(varMap, pID, path):
+	"""
+	Counts every pattern of varMap["patterns"] (see Helpers.pattern_configs) on one file. Patterns are grouped by
+	their relevant speakers, which decide the events kept in the sequence. Each group's sequence is built and
+	scanned once into transition counts, and every pattern of the group is counted from those.
+	:param varMap:
+	:param pID:
+	:param path:
+	:return tuple of the long-format headings and the list of result rows, one per pattern:
+	"""
+	print 'Pattern matching in progress on pID=' + str(pID) + ', file=' + path
+	stamp = FileStamp(path)
+	CSV = os.path.splitext(path)[1] == '.csv'
+	events = None
+	groups = {} # key:transition cache key, value:TransitionCounts
+	rows = []
+	for name, patternMap in pattern_configs(varMap):
+		eiList = EItemList(_varMap=patternMap, pid=pID, filename=path)
+		key = (os.path.abspath(path), stamp, eiList.SelectionKey())
+		counts = groups.get(key)
+		if counts is None:
+			counts = Transitions.Lookup(key)
+		if counts is None:
+			print '+++ Scanning events for speakers ' + ','.join(sorted(eiList.relevantSpkrs)) + ' ...'
+			scan = EItemList(_varMap=patternMap, pid=pID, filename=path)
+			if CSV:
+				LoadEvents(scan, path)
+			else:
+				# groups differ in the events they keep, so they all start from the complete stream
+				if events is None:
+					events = Ingest(path).events
+					Release(path)
+				scan.AddEvents(events)
+			scan.InsertPauses(CSV = CSV, trim = not scan.keepAllPauses)
+			counts = scan.CountTransitions()
+			Transitions.Store(key, counts)
+		groups[key] = counts
+
+		eiList.ApplyTransitions(counts)
+		r = eiList.ResultsTuple()
+		spkrs = [patternMap[e].replace(',', '+') for e in ['A', 'B', 'C']]
+		rows.append(r[:2] + [name, patternMap['seqType']] + spkrs + r[2:])
+	header = ['PID', 'filename', 'pattern', 'seqType', 'A', 'B', 'C', 'A_count', 'B_count', 'C_count', 'P_count', 'a',
+		'b', 'c', 'd', 'OCV']
+	return header, rows
+
+def AnalyzeRun(varMap, sweep, pID, path):
+	"""
+	Analyses one file, either once with varMap, with a sweep at every grid point, for every pattern of
+	varMap["patterns"], as a whole and per time bin of varMap["binWidth"] minutes, or over each interval of
+	varMap["intervals"].
+	:param varMap:
+	:param sweep: dict of swept setting -> list of values, or None
+	:param pID:
+	:param path:
+	:return tuple of the list of headings and the list of result rows (lists of fields):
+	"""
+	if sweep and varMap.get('patterns'):
+		raise ValueError('A parameter sweep cannot be combined with a pattern list')
+	binned = float(varMap.get('binWidth', '0') or 0) > 0
+	if binned and (sweep or varMap.get('patterns') or int(varMap.get('maxLag', '0') or 0)):
+		raise ValueError('Time bins cannot be combined with a parameter sweep, a pattern list or lags')
+	if varMap.get('intervals') and (sweep or varMap.get('patterns') or binned or int(varMap.get('maxLag', '0') or 0)):
+		raise ValueError('Intervals cannot be combined with a parameter sweep, a pattern list, time bins or lags')
+	if sweep:
+		return SweepFile(varMap, sweep, pID, path)
+	if varMap.get('patterns'):
+		return MatchPatterns(varMap, pID, path)
+	if binned:
+		return BinFile(varMap, pID, path)
+	if varMap.get('intervals'):
+		return IntervalFile(varMap, pID, path)
+	header, row = AnalyzeFile(varMap, pID, path)
+	return header, [row]
+
+def FlagEnds(events):
+	"""
+	Yields the events of a file as (speaker, onset, offset, flag) tuples, with the flag 'Initial' on the first event
+	and 'Terminal' on the last one, as EItemList.AddEvent() expects. A lone event is handed out as both.
+	:param events: iterable of (speaker, onset, offset) tuples
+	:return generator of (speaker, onset, offset, flag) tuples:
+	"""
+	prev = None
+	flag = 'Initial'
+	for event in events:
+		if prev is not None:
+			yield prev + (flag,)
+			flag = None
+		prev = event
+	if prev is not None:
+		if flag == 'Initial':
+			yield prev + (flag,)
+		yield prev + ('Terminal',)
+
+def PoolPerform(job):
+	"""
+	Entry point of the process-pool workers. Runs AnalyzeRun() on a (varMap, sweep, pID, path) job and sends back
+	only the result strings, or the error message if the analysis failed.
+	:param job:
+	:return tuple of the file's pID and path, a success flag and either the (header, results) tuple or the error
+		string:
+	"""
+	varMap, sweep, pID, path = job
+	try:
+		return pID, path, True, AnalyzeRun(varMap, sweep, pID, path)
+	except Exception as e:
+		return pID, path, False, str(e)
+
 class SeqAnalysis:
 	"""
 	Handler class the sequence analysis class. Makes calls to complete sequence analysis.
@@ -347,6 +1154,7 @@ class SeqAnalysis:
 
 		# extract items from seqData object
 		self.varMap = seqData.seq_config
+		self.sweep = seqData.sweep
 
 		# prime for writing output
 		batch_single = None
@@ -356,28 +1164,35 @@ class SeqAnalysis:
 			batch_single = "Single"
 
 		# setup vars
-		self.results = []
+		self.wroteHeader = False
 		self.out_results = out_results
 		self.error_results = []
 		self.stopper = stopper
 		self.tLock = threading.Lock()
 
-		# kick off threads in batch
-		while len(seqData.its_dict) > 0:
-			# prep for run
-			tempItem = {}
-			tempDict = {}
+		# prep for run
+		runs = self.ScheduleRuns(seqData)
+		paths = [run.path for run in runs]
+		self.manifest = Manifest.Manifest(self.varMap['outputDirPath'], Manifest.ConfigKey(self.varMap, self.sweep))
+
+		# results are written as each file is done
+		self.writers = open_writers(OutData(batch_single, seqData.seq_config, None, sweep=bool(self.sweep),
+			patterns=bool(self.varMap.get('patterns'))), seqData.output_format)
+		if seqData.reuse_results:
+			runs = self.ReuseResults(runs)
+
+		if seqData.backend == PROCESS_BACKEND:
+			# spread files across processes
+			self.RunProcesses(runs, seqData.num_threads)
+		else:
+			# persistent worker threads pull runs from a shared queue until it is empty
+			workQueue = Queue.Queue()
+			for run in runs:
+				workQueue.put(run)
+
 			threads = []
-			for i in range(seqData.num_threads):
-				try:
-					tempItem = seqData.its_dict.popitem()
-					tempDict.update({tempItem[0]:tempItem[1]})
-				except KeyError:
-					pass # dict is empty
-			
-			# perform run
-			for k,v in tempDict.iteritems():
-				t = threading.Thread(target=self.Perform, args=(k,v,))
+			for i in range(min(seqData.num_threads, len(runs))):
+				t = threading.Thread(target=self.Worker, args=(workQueue,))
 				t.daemon = True
 				threads.append(t)
 				t.start()
@@ -386,15 +1201,17 @@ class SeqAnalysis:
 			for thread in threads:
 				thread.join()
 
-		if not stopper.is_set():
-			# write output
-			output_data = OutData(batch_single, seqData.seq_config,self.results)
-			if '.xlsx' in seqData.output_format:
-				output_xlsx(output_data)
-			if '.csv' in seqData.output_format:
-				output_csv(output_data)
-			if '.txt' in seqData.output_format:
-				ouput_txt(output_data)
+		# keep what was analysed even if stopped, so that the next run picks up from there
+		self.manifest.Save(paths)
+
+		if stopper.is_set():
+			# a cancelled run leaves no output; its finished files are in the run manifest
+			for writer in self.writers:
+				writer.discard()
+		else:
+			# finish output
+			for writer in self.writers:
+				writer.close()
 
 			# report analysis result
 			if len(self.error_results) > 0:
@@ -403,107 +1220,121 @@ class SeqAnalysis:
 			else:
 				self.out_results.append("Successful Sequence Analysis!")
 
+	def ScheduleRuns(self, seqData):
+		"""
+		Makes a SeqRun of every file of seqData.its_dict. The dict is left as it is, so that the caller can run the
+		same files again, e.g. to resume a cancelled run. With seqData.largest_first the largest files are
+		scheduled first, so that a long recording does not start last and hold up the end of the batch.
+		:param seqData:
+		:return list of SeqRun objects in the order they should be analysed:
+		"""
+		runs = [SeqRun(pID, path) for pID, path in seqData.its_dict.items()]
+
+		if seqData.largest_first:
+			def size(run):
+				try:
+					return os.path.getsize(run.path)
+				except OSError:
+					return 0 # reported as an error by the analysis
+			runs.sort(key=size, reverse=True)
+		return runs
+
+	def ReuseResults(self, runs):
+		"""
+		Takes the results of files unchanged since an earlier run from the run manifest.
+		:param runs:
+		:return list of the runs that still need to be analysed:
+		"""
+		remaining = []
+		for run in runs:
+			found = self.manifest.Lookup(run.p_id, run.path)
+			if found is None:
+				remaining.append(run)
+			else:
+				self.AddResult(found[0], found[1])
+		if len(remaining) < len(runs):
+			print 'Reusing the results of ' + str(len(runs) - len(remaining)) + ' unchanged files'
+		return remaining
+
+	def Worker(self, workQueue):
+		"""
+		Thread target: analyses queued runs one after the other until the queue is empty or the stopper is set.
+		:param workQueue:
+		:return:
+		"""
+		while not self.stopper.is_set():
+			try:
+				run = workQueue.get_nowait()
+			except Queue.Empty:
+				return
+			self.Perform(run.p_id, run.path)
+
+	def RunProcesses(self, runs, num_workers):
+		"""
+		Runs the analysis on a pool of worker processes, one file per task, so that files are analysed in parallel
+		on every core instead of sharing one interpreter. Checks the stopper while waiting for results and
+		terminates the workers when it is set.
+		:param runs:
+		:param num_workers:
+		:return:
+		"""
+		jobs = [(self.varMap, self.sweep, run.p_id, run.path) for run in runs]
+		if len(jobs) == 0:
+			return
+
+		pool = multiprocessing.Pool(processes=max(1, min(num_workers, multiprocessing.cpu_count(), len(jobs))))
+		try:
+			# chunksize of 1 hands out files in schedule order as workers free up
+			pending = pool.imap_unordered(PoolPerform, jobs, 1)
+			for i in range(len(jobs)):
+				while True:
+					if self.stopper.is_set():
+						return
+					try:
+						pID, path, ok, result = pending.next(timeout=0.5)
+						break
+					except multiprocessing.TimeoutError:
+						pass
+
+				if ok:
+					self.AddResult(result[0], result[1])
+					self.manifest.Record(pID, path, result[0], result[1])
+				else:
+					with self.tLock:
+						self.error_results.append(result)
+		finally:
+			pool.terminate()
+			pool.join()
+
+	def AddResult(self, header, rows):
+		"""
+		Writes the results of one file to every output file, preceded by the header if it is the first result.
+		:param header: list of headings
+		:param rows: list of result rows
+		:return:
+		"""
+		# write data with Lock on the output files
+		with self.tLock:
+			if not self.wroteHeader:
+				rows = [header] + rows
+				self.wroteHeader = True
+			for writer in self.writers:
+				writer.write_rows(rows)
 
 	def Perform(self, pID, path):
 		"""
-		Initiates organizing the data for analysis.
-		Looks at the files in the path, and determines course of action for .its files or .csv files to prepare the
-		xml parse tree or the data frame based on the input file type.
-		It then calls the preceding methods to complete analysis.
+		Analyses one file and stores its results, logging any error.
 		:param pID:
 		:param path:
 		:return:
 		"""
-		# retrieve work items from queue
 		if not self.stopper.is_set():
 			try:
-				# Announce
-				print 'Analysis in progress on pID=' + str(pID) + ', file=' + path
-
-				# Define necessary objects
-				eiList = None
-				tree = None
-
-				# INITIALIZE ESSENTIAL OBJECTS
-				#Init event item list
-				print '+++ Generating EItemList() ...'
-				eiList = EItemList(_varMap=self.varMap, pid=pID, filename=path)
-				print '+++ EItemList() created successfully.'
-				
-				if os.path.splitext(path)[1] == '.csv':
-					print '+++ Processing .csv file ...'
-					f = open(path,'r')
-					rows = f.read().replace('\r','').split('\n')
-					f.close()
-					
-					csv_data = []
-					for i in range(1, len(rows)-1):
-						csv_data.append( rows[i].split(',') )
-
-					csv_arr = [csv_data[0][0], csv_data[0][1]] 
-					print '+++ Created data: ' + str(csv_arr) + ' ...'
-
-					eiList.AddEItemCSV(csv_arr, flag='Initial')
-					
-					print '+++ Iterating over rows of .csv file ...'
-					for i in range(1, len(csv_data) - 1):
-						csv_arr[0] = csv_data[i][0]
-						csv_arr[1] = csv_data[i][1]
-						eiList.AddEItemCSV(csv_arr)
-					csv_arr[0] = csv_data[-1][0]
-					csv_arr[1] = csv_data[-1][1]
-					eiList.AddEItemCSV(csv_arr, flag='Terminal')
-
-					#Insert contiguous pauses
-					eiList.InsertPauses(CSV = True)
-				else:
-					#Load xml tree
-					tree = ET.parse(path)
-
-					#Get access to only the conversational segments in the .its file
-					recNode = tree.find("ProcessingUnit")
-					segs = list(recNode.iter("Segment"))
-
-					# iterate over segments and copy
-					eiList.AddEItem( segs[0], flag='Initial' )
-					for i in range(1, len(segs)-1):
-						eiList.AddEItem( segs[i] )
-					eiList.AddEItem( segs[-1], flag='Terminal' )
-
-					# free memory used by xml tree
-					tree = None
-					#Insert contiguous pauses
-					eiList.InsertPauses(CSV = False)
-
-
-				#Remove contiguous pauses
-				if not(eiList.keepAllPauses):
-					eiList.RemoveExtraneousPauses()
-
-				#Tally each item in the EItemList
-				print '+++ Counting items in EItemList ...'
-				eiList.TallyItems()
-
-				#Perform primary analysis
-				print '+++ Performing sequential analysis ...'
-				eiList.SeqAn()
-
-				#write data and break from loop
-				print '+++ Writing data ...'
-				elh = eiList.Header()
-				outputContent = ""
-				with self.tLock:
-					if len(self.results) == 0:
-						self.results.append(elh)
-
-				outputContent += eiList.ResultsTuple()
-
-				# write data with Lock on results
-				with self.tLock:
-					self.results.append(outputContent)
+				elh, outputContent = AnalyzeRun(self.varMap, self.sweep, pID, path)
+				self.AddResult(elh, outputContent)
+				self.manifest.Record(pID, path, elh, outputContent)
 
 			# Log All Errors
 			except Exception as e:
 				with self.tLock:
 					self.error_results.append(str(e))
-					
@@ -0,0 +1,277 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Speaker transition counts of a pause-expanded event sequence. One pass over the sequence counts every speaker,
+every pair of consecutive speakers and every triple of consecutive speakers. The event counts and the a/b/c/d
+table of any A_B, AB_C or A_BC analysis are then sums over these counts, so they can be recomputed for another
+grouping of the same speakers without going back to the events.
+
+Which events end up in the sequence depends on the set of relevant speakers (A, B and C together) and on the
+pause settings, so counts are cached per file under a key made of both.
+"""
+
+from array import array
+from collections import OrderedDict
+from itertools import izip_longest
+import threading
+
+# NumPy is imported on first use rather than with the module, so that loading the analysis stays quick
+numpy = None # the module once imported, False if it is not installed
+
+def NumPy():
+	"""
+	Imports NumPy on first use. Also used by Patterns.
+	:return the numpy module, or None if it is not installed:
+	"""
+	global numpy
+	if numpy is None:
+		try:
+			import numpy as module
+			numpy = module
+		except ImportError:
+			numpy = False
+	return numpy or None
+
+# number of TransitionCounts kept in memory for re-use by later runs
+MAX_CACHED = 4096
+
+# Transition Counts
+class TransitionCounts:
+	"""
+	Unigram, bigram and trigram counts of a sequence of speaker codes, stored as flat arrays indexed by code.
+	"""
+	def __init__(self, spkrs, codes=None, runs=None, pauseCode=None):
+		"""
+		Counts the transitions of a code sequence. With runs, runs[i] pauses (code pauseCode) precede codes[i]
+		and runs[len(codes)] follow the last code. Without codes the counts start empty and are filled by
+		CountBlock() or Count().
+
+		:param spkrs: code -> speaker label
+		:param codes: sequence of speaker codes, or None
+		:param runs: number of pauses before each code, or None
+		:param pauseCode:
+		"""
+		self.spkrs = list(spkrs)
+		self.pauseCode = pauseCode
+		self.size = 0
+		self.prev2 = self.prev1 = None # last two codes counted
+		n = len(self.spkrs)
+		self.unigrams = array('L', [0] * n)
+		self.bigrams = array('L', [0] * (n * n))
+		self.trigrams = array('L', [0] * (n * n * n))
+		if codes is not None:
+			self.CountBlock(codes, runs)
+
+	def CountBlock(self, codes, runs=None):
+		"""
+		Counts the next block of the sequence: codes[i] preceded by runs[i] pauses, followed by runs[len(codes)]
+		pauses if runs has that extra entry. With NumPy the block is counted with array operations, otherwise one
+		event at a time by Count().
+
+		:param codes: speaker codes (array('H'))
+		:param runs: number of pauses before each code (array('L')), or None
+		:return:
+		"""
+		if NumPy() is None:
+			for code, k in izip_longest(codes, runs or ()):
+				self.Count(code, k or 0)
+			return
+
+		n = len(self.spkrs)
+		m = len(codes)
+		c = numpy.frombuffer(codes, dtype=numpy.uint16).astype(numpy.intp)
+		k = numpy.zeros(m + 1, dtype=numpy.intp)
+		if runs is not None and len(runs):
+			k[:len(runs)] = numpy.frombuffer(runs, dtype=numpy.dtype(runs.typecode))
+		P = self.pauseCode if self.pauseCode is not None else 0 # without a pause code every run is empty
+
+		# the block as one array, with every run of pauses cut to at most three; the pauses further into a run
+		# only add a Pause->Pause pair and a Pause triple each, which are added at the end
+		short = numpy.minimum(k, 3)
+		values = numpy.empty(2 * m + 1, dtype=numpy.intp)
+		values[0::2] = P
+		values[1::2] = c
+		repeats = numpy.ones(2 * m + 1, dtype=numpy.intp)
+		repeats[0::2] = short
+		s = numpy.repeat(values, repeats)
+
+		# the last two codes of the previous block start the pairs and triples across the block boundary
+		prefix = [x for x in (self.prev2, self.prev1) if x is not None]
+		p = len(prefix)
+		if p:
+			s = numpy.concatenate((numpy.array(prefix, dtype=numpy.intp), s))
+		i = max(p, 1)
+		j = max(p, 2)
+		self._Add(self.unigrams, numpy.bincount(s[p:], minlength=n))
+		self._Add(self.bigrams, numpy.bincount(s[i-1:-1] * n + s[i:], minlength=n*n))
+		self._Add(self.trigrams, numpy.bincount((s[j-2:-2] * n + s[j-1:-1]) * n + s[j:], minlength=n*n*n))
+		extra = int((k - short).sum())
+		if extra:
+			self.unigrams[P] += extra
+			self.bigrams[P * n + P] += extra
+			self.trigrams[(P * n + P) * n + P] += extra
+		self.size += m + int(k.sum())
+
+		last = s[-2:].tolist()
+		if last:
+			self.prev1 = last[-1]
+			self.prev2 = last[-2] if len(last) == 2 else None
+
+	def _Add(self, table, counts):
+		"""
+		Adds a NumPy array of counts to a count table.
+		"""
+		for index in numpy.flatnonzero(counts).tolist():
+			table[index] += int(counts[index])
+
+	def Count(self, code, pauses=0):
+		"""
+		Counts the next event of the sequence, preceded by a run of pauses. A run of k pauses is counted in closed
+		form: it adds k-1 Pause->Pause pairs and k-2 Pause triples.
+
+		:param code: speaker code, or None for pauses after the last event
+		:param pauses: number of pauses before the event
+		:return:
+		"""
+		n = len(self.spkrs)
+		prev2 = self.prev2
+		prev1 = self.prev1
+		if pauses:
+			P = self.pauseCode
+			k = pauses
+			self.size += k
+			self.unigrams[P] += k
+			# the first pause follows the last two items, the second one the last item and the first pause,
+			# and every further pause two pauses
+			if prev1 is not None:
+				self.bigrams[prev1 * n + P] += 1
+				if prev2 is not None:
+					self.trigrams[(prev2 * n + prev1) * n + P] += 1
+			if k >= 2:
+				self.bigrams[P * n + P] += k - 1
+				if prev1 is not None:
+					self.trigrams[(prev1 * n + P) * n + P] += 1
+				self.trigrams[(P * n + P) * n + P] += k - 2
+				prev2 = P
+			else:
+				prev2 = prev1
+			prev1 = P
+
+		if code is not None:
+			self.size += 1
+			self.unigrams[code] += 1
+			if prev1 is not None:
+				self.bigrams[prev1 * n + code] += 1
+				if prev2 is not None:
+					self.trigrams[(prev2 * n + prev1) * n + code] += 1
+			prev2 = prev1
+			prev1 = code
+		self.prev2 = prev2
+		self.prev1 = prev1
+
+	def Tally(self, member):
+		"""
+		Returns the number of events whose speaker belongs to a class.
+
+		:param member: membership of each speaker code in the class
+		:return integer count:
+		"""
+		return sum(count for code, count in enumerate(self.unigrams) if member[code])
+
+	def Contingencies(self, seqType, inA, inB, inC):
+		"""
+		Returns the a/b/c/d cells of a sequence analysis, the same as counting them along the sequence these
+		transitions came from.
+
+		:param seqType: 'A_B', 'AB_C' or 'A_BC'
+		:param inA: membership of each speaker code in A
+		:param inB: membership of each speaker code in B
+		:param inC: membership of each speaker code in C
+		:return dict of the contingency cells:
+		"""
+		cells = {"a":0, "b":0, "c":0, "d":0}
+		n = len(self.spkrs)
+		if seqType == 'A_B':
+			# A-->B
+			for i in range(n):
+				for j in range(n):
+					count = self.bigrams[i * n + j]
+					if count:
+						cells[Cell(inA[i], inB[j])] += count
+		elif seqType in ('AB_C', 'A_BC'):
+			# (A-->B)-->C or A-->(B-->C)
+			for i in range(n):
+				for j in range(n):
+					base = (i * n + j) * n
+					for k in range(n):
+						count = self.trigrams[base + k]
+						if not count:
+							continue
+						if seqType == 'AB_C':
+							cells[Cell(inA[i] and inB[j], inC[k])] += count
+						else:
+							cells[Cell(inA[i], inB[j] and inC[k])] += count
+		return cells
+
+def Cell(curr, next):
+	"""
+	Returns the contingency cell of an antecedent/consequent pair.
+	:param curr:
+	:param next:
+	:return 'a', 'b', 'c' or 'd':
+	"""
+	if curr:
+		return 'a' if next else 'b'
+	return 'c' if next else 'd'
+
+# Transition cache
+_cache = OrderedDict() # key:(path, file stamp, selection key), value:TransitionCounts
+_cacheLock = threading.Lock()
+
+def Lookup(key):
+	"""
+	Returns the cached counts for key, or None.
+	:param key:
+	:return TransitionCounts or None:
+	"""
+	with _cacheLock:
+		counts = _cache.pop(key, None)
+		if counts is not None:
+			_cache[key] = counts # most recently used last
+		return counts
+
+def Store(key, counts):
+	"""
+	Caches counts under key, evicting the least recently used entries beyond MAX_CACHED.
+	:param key:
+	:param counts:
+	:return:
+	"""
+	with _cacheLock:
+		_cache.pop(key, None)
+		_cache[key] = counts
+		while len(_cache) > MAX_CACHED:
+			_cache.popitem(last=False)
+
+def Clear():
+	"""
+	Empties the transition cache.
+	:return:
+	"""
+	with _cacheLock:
+		_cache.clear()
@@ -0,0 +1,190 @@
+"""
+The MIT License (MIT)
+Copyright (c) 2018 Paul Yoder et al.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+IN THE SOFTWARE.
+
+Command-line entry point for running an analysis without the user interface, e.g. on a headless machine or from
+cron. The analysis is set up by a .leco file as written by the UI's save option; the input and output directories
+and the output formats of the file can be overridden on the command line.
+
+Usage:
+    python cli.py CONFIG.leco [--input DIR] [--output DIR] [--format csv,xlsx,txt] [--workers N]
+                  [--backend thread|process] [--sweep SETTING=V1,V2 ...] [--patterns FILE] [--no-cache]
+                  [--full]
+
+Exit codes: 0 if every file was analysed, 1 if the analysis of any file failed, 2 for an invalid command line or
+configuration, 130 if interrupted.
+"""
+
+import argparse
+import ast
+import multiprocessing
+import os
+import sys
+import threading
+
+from Batch import Batch
+from Helpers import *
+from SeqAnalysis2 import SeqAnalysis
+import EventCache
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def read_literal(path):
+    """
+    Reads a file holding a single Python literal, the format of .leco files.
+    :param path:
+    :return the literal's value:
+    """
+    with open(path, 'r') as f:
+        return ast.literal_eval(f.read())
+
+
+def load_config(args):
+    """
+    Loads the .leco file named on the command line, applies the command-line overrides and checks the result.
+    Raises ValueError if the configuration is invalid.
+    :param args: parsed command line
+    :return seq_config dict:
+    """
+    seq_config = read_literal(args.config)
+    if type(seq_config) is not dict:
+        raise ValueError(args.config + " does not hold a configuration")
+
+    if args.input:
+        seq_config['batDir'] = args.input
+    if args.output:
+        seq_config['outputDirPath'] = args.output
+    if args.format:
+        seq_config['outputTypes'] = args.format
+    if args.patterns:
+        patterns = read_literal(args.patterns)
+        if type(patterns) is not list:
+            raise ValueError(args.patterns + " does not hold a list of patterns")
+        seq_config['patterns'] = patterns
+    validate_config(seq_config)
+
+    for key in ('batDir', 'outputDirPath'):
+        if not os.path.isdir(seq_config[key]):
+            raise ValueError(key + " is not a directory: " + seq_config[key])
+
+    # set by the UI rather than saved with the configuration
+    seq_config['outputContent'] = ""
+    seq_config['P'] = 'Pause'
+    return seq_config
+
+
+def parse_sweep(specs):
+    """
+    Turns --sweep SETTING=V1,V2 arguments into the sweep dict of SeqData, see normalize_sweep().
+    :param specs: list of SETTING=V1,V2 strings
+    :return dict of setting -> list of values, or None:
+    """
+    sweep = {}
+    for spec in specs:
+        key, sep, values = spec.partition('=')
+        if not sep or key not in SWEEP_KEYS or not values:
+            raise ValueError("Invalid sweep " + spec + ", expected one of " + ', '.join(SWEEP_KEYS) + "=V1,V2,...")
+        sweep[key] = values.split(',')
+    return normalize_sweep(sweep) or None
+
+
+def build_parser():
+    """
+    Builds the command-line parser.
+    :return argparse.ArgumentParser:
+    """
+    parser = argparse.ArgumentParser(description='Runs a LENA contingency analysis without the user interface.')
+    parser.add_argument('config', help='.leco configuration file saved from the UI')
+    parser.add_argument('--input', help='directory of .its files, in place of the configured one')
+    parser.add_argument('--output', help='directory for the output files, in place of the configured one')
+    parser.add_argument('--format', help='output formats, e.g. "csv,xlsx", in place of the configured ones')
+    parser.add_argument('--workers', type=int, default=4, help='number of files analysed at once (default 4)')
+    parser.add_argument('--backend', choices=[THREAD_BACKEND, PROCESS_BACKEND], default=THREAD_BACKEND,
+                        help='run the workers as threads or as processes (default thread)')
+    parser.add_argument('--sweep', action='append', default=[], metavar='SETTING=V1,V2',
+                        help='analyse every file at each value of a setting; may be repeated')
+    parser.add_argument('--patterns', metavar='FILE', help='file holding a list of patterns to count')
+    parser.add_argument('--no-cache', action='store_true', help='do not read or write the on-disk event cache')
+    parser.add_argument('--full', action='store_true',
+                        help='analyse every file, also those unchanged since the last run of this analysis')
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the analysis described by the command line.
+    :param argv: command-line arguments, sys.argv[1:] if None
+    :return exit code:
+    """
+    args = build_parser().parse_args(argv)
+    try:
+        seq_config = load_config(args)
+        sweep = parse_sweep(args.sweep)
+        if args.workers < 1:
+            raise ValueError("--workers must be at least 1")
+    except (IOError, SyntaxError, ValueError, KeyError) as e:
+        sys.stderr.write("error: " + str(e) + "\n")
+        return EXIT_USAGE
+
+    if args.no_cache:
+        EventCache.ENABLED = False
+
+    # k:ID v:path/to/file, as the UI builds it
+    file_dict = dict((subID, paths[0]) for subID, paths in Batch(seq_config['batDir']).items.items())
+    if not file_dict:
+        sys.stderr.write("error: no .its files in " + seq_config['batDir'] + "\n")
+        return EXIT_USAGE
+
+    data = SeqData(file_dict, seq_config, args.workers, output_formats(seq_config), args.backend, sweep=sweep,
+                   reuse_results=not args.full)
+    results = []
+    stopper = threading.Event()
+
+    # analyse in a worker thread so that Ctrl-C reaches this one
+    thread = threading.Thread(target=SeqAnalysis, args=(data, results, stopper))
+    thread.daemon = True
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)
+    except KeyboardInterrupt:
+        stopper.set()
+        sys.stderr.write("interrupted, stopping...\n")
+        # wait for the analysis to discard its partial output files and save the run manifest, as the UI does; a
+        # second Ctrl-C exits at once
+        try:
+            while thread.is_alive():
+                thread.join(0.5)
+        except KeyboardInterrupt:
+            pass
+        return EXIT_INTERRUPTED
+
+    for line in results:
+        print line
+    if not results or any("Failed" in line for line in results):
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    # needed by the process backend in frozen Windows builds
+    multiprocessing.freeze_support()
+    sys.exit(main())
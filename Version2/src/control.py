@@ -25,6 +25,7 @@ except:
     from tkinter import *
 
 from LenaUI import *
+import multiprocessing
 import time
 
 
@@ -41,6 +42,8 @@ def main():
     # Launch database
     
 if __name__ == "__main__":
+    # needed by the process backend in frozen Windows builds
+    multiprocessing.freeze_support()
     main()
 
 